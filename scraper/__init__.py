@@ -0,0 +1,2 @@
+# Importing the package or any of its modules does no I/O; the scrapers set up their
+# sessions, caches and existing-ID sets when their run() or main() is called.
@@ -0,0 +1,37 @@
+import importlib
+import sys
+
+# python -m scraper <command> [options]; each command maps to a module with a main(argv)
+COMMANDS = {
+    'core': ('core_scraper', 'scrape completed events, fights and fighters'),
+    'upcoming': ('upcoming_scraper', 'sync the upcoming cards'),
+    'defensive': ('defensive_stats_scraper', 'calculate defensive stats'),
+    'derived': ('derived_stats_calculator', 'calculate derived stats'),
+    'combine': ('combine_fighter_stats', 'combine fighter, defensive and derived stats'),
+    'badges': ('badges_assigner', 'assign badges'),
+    'distribution': ('badge_distribution', 'report the badge distribution'),
+    'calibrate': ('badge_calibration', 'search badge thresholds for target percentages'),
+    'comprehensive': ('comprehensive_fighter_details', 'merge stats and badges for upload'),
+    'export': ('datastore', 'write pending CSV snapshots from the typed store'),
+    'upload': ('upload_to_firestore', 'upload the CSVs to Firestore'),
+    'reparse': ('reparse', 'rebuild the CSVs from the page archive'),
+    'watch': ('watch', 'push live results during an event'),
+    'schedule': ('scheduler', 'work out which pipeline stages are due')
+}
+
+def usage():
+    lines = ["usage: python -m scraper <command> [options]", "", "commands:"]
+    lines.extend(f"  {name:<14}{help_text}" for name, (_, help_text) in COMMANDS.items())
+    return "\n".join(lines)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print(usage(), file=sys.stderr)
+        return 2
+    module = importlib.import_module(f"{__package__}.{COMMANDS[argv[0]][0]}")
+    module.main(argv[1:])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+
+import pandas as pd
+
+from .datastore import dataset_version, load_dataset
+
+logger = logging.getLogger('appearances')
+
+# One row per fighter per fight, shared by every stats stage of a pipeline run
+APPEARANCES_FILE = os.path.join('.cache', 'appearances.parquet')
+# Versions of the datasets the cached table was built from
+SOURCES_FILE = os.path.join('.cache', 'appearances_sources.json')
+SOURCE_DATASETS = ['fight_details', 'event_details']
+FIGHT_DATE_FORMAT = '%Y/%m/%d'
+
+# First matching substring of the lower-cased method wins, e.g. "TKO - Doctor's Stoppage" is ko_tko
+METHOD_CATEGORIES = [('ko_tko', 'ko'), ('submission', 'submission'), ('decision', 'decision')]
+OTHER_METHOD = 'other'
+
+def categorize_methods(methods):
+    lowered = methods.str.lower()
+    category = pd.Series(OTHER_METHOD, index=methods.index)
+    for name, pattern in reversed(METHOD_CATEGORIES):
+        category = category.mask(lowered.str.contains(pattern, regex=False, na=False), name)
+    return pd.Categorical(category, categories=[name for name, _ in METHOD_CATEGORIES] + [OTHER_METHOD])
+
+# The stats stages were written against CSV-inferred dtypes: counts stored as float32 are
+# widened back to float64 and nullable integers become int64, or float64 when values are missing
+def _widen_dtypes(df):
+    df = df.copy()
+    for column in df.columns:
+        dtype = df[column].dtype
+        if dtype == 'float32':
+            df[column] = df[column].astype('float64')
+        elif pd.api.types.is_extension_array_dtype(dtype) and dtype.kind in 'iu':
+            df[column] = df[column].astype('float64' if df[column].hasnans else 'int64')
+    return df
+
+# Stacks the red and blue corners: every r_<col>/b_<col> pair becomes own_<col> and opp_<col>
+# from the fighter's point of view, bout columns are repeated and `corner` says which side it was
+def build_appearances(fight_df, event_df):
+    fight_df = _widen_dtypes(fight_df).merge(event_df[['fight_id', 'winner_id']], on='fight_id', how='left')
+    paired = [column[2:] for column in fight_df.columns if column.startswith('r_') and f"b_{column[2:]}" in fight_df.columns]
+    bout = fight_df.drop(columns=[f"{corner}_{column}" for column in paired for corner in ('r', 'b')])
+    corners = []
+    for corner, opponent in (('r', 'b'), ('b', 'r')):
+        own = fight_df[[f"{corner}_{column}" for column in paired]].set_axis([f"own_{column}" for column in paired], axis=1)
+        opp = fight_df[[f"{opponent}_{column}" for column in paired]].set_axis([f"opp_{column}" for column in paired], axis=1)
+        corners.append(pd.concat([bout, own, opp], axis=1).assign(corner=corner))
+    df = pd.concat(corners, ignore_index=True)
+    df['won'] = df['winner_id'] == df['own_id']
+    df['method_category'] = categorize_methods(df['method'])
+    if 'date' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['date']):
+        df['date'] = pd.to_datetime(df['date'], format=FIGHT_DATE_FORMAT, errors='coerce')
+    return df
+
+def _source_signature():
+    return {name: dataset_version(name) for name in SOURCE_DATASETS}
+
+def _cached_signature():
+    try:
+        with open(SOURCES_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _save_cache(df, signature):
+    os.makedirs(os.path.dirname(APPEARANCES_FILE), exist_ok=True)
+    tmp_path = APPEARANCES_FILE + '.tmp'
+    try:
+        df.to_parquet(tmp_path, index=False)
+    except ImportError as e:
+        logger.warning(f"Not caching appearances, no parquet engine available: {str(e)}")
+        return
+    os.replace(tmp_path, APPEARANCES_FILE)
+    with open(SOURCES_FILE, 'w', encoding='utf-8') as f:
+        json.dump(signature, f)
+
+# Appearance table for the current fight_details and event_details datasets, read from the
+# parquet cache when neither changed since it was built; columns= projects the read
+def load_appearances(columns=None):
+    signature = _source_signature()
+    if _cached_signature() == signature:
+        try:
+            return pd.read_parquet(APPEARANCES_FILE, columns=columns)
+        except (ImportError, OSError, ValueError) as e:
+            logger.warning(f"Rebuilding appearances, cache unreadable: {str(e)}")
+    df = build_appearances(load_dataset('fight_details'), load_dataset('event_details', ['fight_id', 'winner_id']))
+    _save_cache(df, signature)
+    logger.info(f"Built {len(df)} fighter appearances from {len(df) // 2} fights.")
+    return df if columns is None else df[columns]
@@ -0,0 +1,148 @@
+import argparse
+import functools
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .badge_rules import BADGE_RULES, OPERATORS, STAT_COLUMNS, BadgeRule, Condition, badge_distribution, badge_features, evaluate_badges
+from .datastore import load_dataset
+
+logger = logging.getLogger('badge_calibration')
+
+DEFAULT_TARGET_PERCENTAGE = 8.0
+# Candidate threshold combinations scored per badge and search round; each tunable
+# condition gets about CANDIDATES_PER_BADGE ** (1 / conditions) values
+CANDIDATES_PER_BADGE = 4096
+SEARCH_ROUNDS = 3
+# Candidates this close to the best percentage are ranked by how little they move the current thresholds
+TOLERANCE_PERCENTAGE = 0.05
+
+def tunable_conditions(conditions):
+    found = []
+    for condition in conditions:
+        if isinstance(condition, Condition):
+            if not condition.fixed and condition.op != '==':
+                found.append(condition)
+        else:
+            found.extend(tunable_conditions(condition))
+    return found
+
+# Mask of shape (len(grid_1), ..., len(grid_k), fighters): tunable condition d takes its
+# threshold from grids[d] along axis d, every other condition keeps its own threshold
+def candidate_masks(features, rule, grids):
+    axes = iter(range(len(grids)))
+    dims = len(grids)
+
+    def mask(condition):
+        if not isinstance(condition, Condition):
+            return functools.reduce(np.logical_or, [mask(alternative) for alternative in condition])
+        if condition.fixed or condition.op == '==':
+            return OPERATORS[condition.op](features[condition.feature], condition.threshold)
+        axis = next(axes)
+        thresholds = grids[axis].reshape([-1 if d == axis else 1 for d in range(dims)] + [1])
+        return OPERATORS[condition.op](features[condition.feature], thresholds)
+
+    return functools.reduce(np.logical_and, [mask(condition) for condition in rule.conditions])
+
+def _initial_grid(values, current, size):
+    grid = np.quantile(values, np.linspace(0, 1, size)) if len(values) else np.array([])
+    return np.unique(np.append(grid, current))
+
+# Narrows each grid to the span between the neighbours of the chosen value
+def _refine_grid(grid, chosen, size):
+    index = int(np.searchsorted(grid, chosen))
+    low, high = grid[max(index - 1, 0)], grid[min(index + 1, len(grid) - 1)]
+    return np.unique(np.append(np.linspace(low, high, size), chosen))
+
+# Grid search, refined over SEARCH_ROUNDS, for the thresholds of one rule that bring its
+# share of fighters closest to target_percentage; returns the calibrated rule
+def calibrate_rule(features, rule, target_percentage, fighters):
+    conditions = tunable_conditions(rule.conditions)
+    if not conditions:
+        return rule
+    size = max(3, int(round(CANDIDATES_PER_BADGE ** (1 / len(conditions)))))
+    # Quantiles over the fighters that pass the eligibility gates, where the cutoffs matter
+    fixed = [condition for condition in rule.conditions if isinstance(condition, Condition) and (condition.fixed or condition.op == '==')]
+    eligible = functools.reduce(np.logical_and, [OPERATORS[c.op](features[c.feature], c.threshold) for c in fixed], np.ones(fighters, dtype=bool))
+    grids = [_initial_grid(features[c.feature][eligible], c.threshold, size) for c in conditions]
+    current = np.array([c.threshold for c in conditions], dtype=float)
+    scales = np.array([np.std(features[c.feature][eligible]) or 1.0 for c in conditions])
+
+    chosen = current
+    for _ in range(SEARCH_ROUNDS):
+        percentages = candidate_masks(features, rule, grids).sum(axis=-1) / fighters * 100
+        error = np.abs(percentages - target_percentage)
+        mesh = np.meshgrid(*grids, indexing='ij')
+        distance = sum(np.abs(mesh[d] - current[d]) / scales[d] for d in range(len(conditions)))
+        distance = np.where(error <= error.min() + TOLERANCE_PERCENTAGE, distance, np.inf)
+        best = np.unravel_index(np.argmin(distance), distance.shape)
+        chosen = np.array([grids[d][best[d]] for d in range(len(conditions))])
+        grids = [_refine_grid(grids[d], chosen[d], size) for d in range(len(conditions))]
+
+    values = iter(chosen)
+
+    def replace(condition):
+        if not isinstance(condition, Condition):
+            return tuple(replace(alternative) for alternative in condition)
+        if condition.fixed or condition.op == '==':
+            return condition
+        return condition._replace(threshold=float(next(values)))
+
+    return BadgeRule(rule.name, [replace(condition) for condition in rule.conditions])
+
+def _describe_changes(rule, calibrated):
+    changes = []
+    for old, new in zip(tunable_conditions(rule.conditions), tunable_conditions(calibrated.conditions)):
+        changes.append(f"{old.feature} {old.op} {old.threshold:g} -> {new.threshold:.4g}")
+    return "; ".join(changes)
+
+def calibrate(fighters_df, targets, rules=BADGE_RULES):
+    features = badge_features(fighters_df)
+    fighters = len(fighters_df)
+    calibrated = [calibrate_rule(features, rule, targets[rule.name], fighters) for rule in rules]
+    before = badge_distribution(evaluate_badges(features, rules))
+    after = badge_distribution(evaluate_badges(features, calibrated))
+    report = pd.DataFrame({
+        'Badge': [rule.name for rule in rules],
+        'Target': [targets[rule.name] for rule in rules],
+        'Current': before['Percentage'].values,
+        'Calibrated': after['Percentage'].values,
+        'Count': after['Count'].values,
+        'Thresholds': [_describe_changes(rule, new) for rule, new in zip(rules, calibrated)]
+    })
+    return calibrated, report
+
+def parse_targets(default, overrides, rules=BADGE_RULES):
+    targets = {rule.name: default for rule in rules}
+    for override in overrides:
+        name, _, value = override.rpartition('=')
+        if name not in targets:
+            raise ValueError(f"Unknown badge '{name}', expected one of: {', '.join(targets)}")
+        targets[name] = float(value)
+    return targets
+
+def main(argv=None):
+    logging.basicConfig(filename='badge_calibration_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Search badge thresholds that hit target badge percentages over fighters_stats.csv')
+    parser.add_argument('--target', type=float, default=DEFAULT_TARGET_PERCENTAGE, help='target percentage of fighters for every badge')
+    parser.add_argument('--badge', action='append', default=[], metavar='NAME=PERCENT', help='target for one badge, may be repeated')
+    parser.add_argument('--output', help='also write the report to this CSV file')
+    args = parser.parse_args(argv)
+
+    try:
+        targets = parse_targets(args.target, args.badge)
+    except ValueError as e:
+        parser.error(str(e))
+    fighters_df = load_dataset('fighters_stats', STAT_COLUMNS)
+    _, report = calibrate(fighters_df, targets)
+    for row in report.itertuples(index=False):
+        logger.info(f"{row.Badge}: {row.Current}% -> {row.Calibrated}% (target {row.Target}%) {row.Thresholds}")
+    if args.output:
+        report.to_csv(args.output, index=False)
+    with pd.option_context('display.max_colwidth', None, 'display.width', 200):
+        print(f"Badge calibration over {len(fighters_df)} fighters:")
+        print(report.to_string(index=False))
+
+if __name__ == '__main__':
+    main()
@@ -1,70 +1,33 @@
-import pandas as pd
 import logging
 import os
-import csv
 from datetime import datetime
+from .badge_rules import STAT_COLUMNS, badge_distribution, badge_features, evaluate_badges
+from .datastore import csv_path, dataset_exists, load_dataset, save_dataset, store_path
 
-logging.basicConfig(filename='badge_distribution_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('badge_distribution')
 
+def save_badge_distribution(df):
+    save_dataset('badge_distribution', df)
+    for badge, count, percentage in zip(df['Badge'], df['Count'], df['Percentage']):
+        logger.info(f"Badge: {badge}, Count: {count}, Percentage: {percentage:.2f}%")
+    logger.info(f"Generated badge_distribution.csv with distribution for {len(df)} badges")
+
+# Recomputes the distribution from fighters_stats with the badge rules; badges_assigner
+# writes the same table alongside badges.csv
 def calculate_badge_distribution():
     try:
-        file_path = 'data/badges.csv'
-        abs_file_path = os.path.abspath(file_path)
-        if not os.path.exists(abs_file_path):
-            logger.error(f"File not found: {abs_file_path}")
-            raise FileNotFoundError(f"File not found: {abs_file_path}")
+        if not dataset_exists('fighters_stats'):
+            logger.error(f"File not found: {os.path.abspath(csv_path('fighters_stats'))}")
+            raise FileNotFoundError(f"File not found: {os.path.abspath(csv_path('fighters_stats'))}")
         
-        # Log file timestamp
-        file_mtime = os.path.getmtime(abs_file_path)
-        file_timestamp = datetime.fromtimestamp(file_mtime).strftime('%Y-%m-%d %H:%M:%S')
-        logger.info(f"Loading file: {abs_file_path} (Last modified: {file_timestamp})")
-        badges_df = pd.read_csv(file_path, quoting=csv.QUOTE_ALL)
-        logger.info(f"Loaded badges.csv with {len(badges_df)} fighters")
-
-        badge_counts = {
-            'KO Creamer': 0,
-            'Bakers Dozen': 0,
-            'Russian Bear': 0,
-            'Pie-thon': 0,
-            'Doughmaker': 0,
-            'Kickin’ Pot Pie': 0,
-            'Greasy': 0,
-            'Can’t Touch This': 0,
-            'Iron Chin': 0,
-            'Locksmith': 0,
-            'The Dogwalker': 0,
-            'Champ Rounds': 0
-        }
-        total_fighters = len(badges_df)
-        bakers_dozen_fighters = []
-
-        for _, row in badges_df.iterrows():
-            badges = str(row['badges']).split(',') if pd.notnull(row['badges']) else []
-            for badge in badges:
-                badge = badge.strip()
-                if badge in badge_counts:
-                    badge_counts[badge] += 1
-                    if badge == 'Bakers Dozen':
-                        bakers_dozen_fighters.append(row['id'])
-                        logger.info(f"Bakers Dozen found for fighter {row['id']}: badges={row['badges']}")
-                else:
-                    logger.warning(f"Unrecognized badge '{badge}' for fighter {row['id']}")
-
-        logger.info(f"Bakers Dozen fighters: {bakers_dozen_fighters}")
-        distribution = []
-        for badge, count in badge_counts.items():
-            percentage = (count / total_fighters * 100) if total_fighters > 0 else 0
-            distribution.append({
-                'Badge': badge,
-                'Count': count,
-                'Percentage': round(percentage, 2)
-            })
-            logger.info(f"Badge: {badge}, Count: {count}, Percentage: {percentage:.2f}%")
-
-        df = pd.DataFrame(distribution)
-        df.to_csv('data/badge_distribution.csv', index=False)
-        logger.info(f"Generated badge_distribution.csv with distribution for {len(badge_counts)} badges")
+        fighters_df = load_dataset('fighters_stats', STAT_COLUMNS)
+        # Log the timestamp of the copy that was read
+        file_path = os.path.abspath(store_path('fighters_stats') if os.path.exists(store_path('fighters_stats')) else csv_path('fighters_stats'))
+        file_timestamp = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d %H:%M:%S')
+        logger.info(f"Loaded {file_path} (Last modified: {file_timestamp}) with {len(fighters_df)} fighters")
+
+        df = badge_distribution(evaluate_badges(badge_features(fighters_df)))
+        save_badge_distribution(df)
         print(f"Badge Distribution:")
         print(df)
 
@@ -72,6 +35,9 @@ def calculate_badge_distribution():
         logger.error(f"Failed to calculate badge distribution: {str(e)}")
         raise
 
+def main(argv=None):
+    logging.basicConfig(filename='badge_distribution_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    calculate_badge_distribution()
+
 if __name__ == '__main__':
-    import csv
-    calculate_badge_distribution()
\ No newline at end of file
+    main()
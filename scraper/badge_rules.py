@@ -0,0 +1,95 @@
+import operator
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# A badge is awarded when every condition holds. A condition compares one feature column
+# against a threshold; a tuple of conditions in a rule means any one of them is enough.
+# Fixed conditions are eligibility gates (enough fights, has wins) rather than tuned cutoffs.
+Condition = namedtuple('Condition', ['feature', 'op', 'threshold', 'fixed'], defaults=[False])
+BadgeRule = namedtuple('BadgeRule', ['name', 'conditions'])
+
+OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '==': operator.eq}
+
+# fighters_stats.csv columns the rules read; missing values count as 0
+STAT_COLUMNS = ['wins', 'ko_tko_wins', 'sub_wins', 'total_fights', 'strikes_attempted', 'kd', 'splm', 'splm_std',
+                'td_avg', 'career_td_acc', 'ctrl_avg', 'sub_att', 'ground_finish_rate', 'ground_landed_per_tko',
+                'leg_landed_avg', 'body_landed_avg', 'td_def', 'td_attempts_received_avg', 'str_def', 'sapm',
+                'kd_received_avg', 'ko_loss_rate', 'sub_att_received_avg', 'never_submitted', 'total_fight_time_sec',
+                'sig_str_landed_per_sec', 'five_round_fights', 'five_round_wins', 'five_round_decision_rate',
+                'five_round_win_rate']
+
+def _ratio(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.zeros(len(numerator)), where=denominator > 0)
+
+# Features computed from other columns; a zero denominator gives 0
+DERIVED_FEATURES = {
+    'ko_tko_ratio': lambda f: _ratio(f['ko_tko_wins'], f['wins']),
+    'sub_wins_ratio': lambda f: _ratio(f['sub_wins'], f['wins']),
+    'kd_per_strike': lambda f: _ratio(f['kd'], f['strikes_attempted']),
+    'sub_att_per_fight': lambda f: _ratio(f['sub_att'], f['total_fights']),
+    'leg_body_landed_avg': lambda f: f['leg_landed_avg'] + f['body_landed_avg'],
+    'sub_att_received_total': lambda f: f['sub_att_received_avg'] * f['total_fights'],
+    'fight_time_per_fight': lambda f: _ratio(f['total_fight_time_sec'], f['total_fights'])
+}
+
+HAS_WINS = Condition('wins', '>', 0, True)
+FIVE_FIGHTS = Condition('total_fights', '>=', 5, True)
+
+BADGE_RULES = [
+    BadgeRule('KO Creamer', [HAS_WINS, Condition('ko_tko_ratio', '>', 0.22), Condition('kd_per_strike', '>', 0.0018),
+                             Condition('splm', '<', 7.0)]),
+    BadgeRule('Bakers Dozen', [HAS_WINS, Condition('splm', '>', 4.7), Condition('splm_std', '<', 35.0), FIVE_FIGHTS]),
+    BadgeRule('Russian Bear', [HAS_WINS, Condition('td_avg', '>', 2.3), Condition('career_td_acc', '>', 38),
+                               Condition('ctrl_avg', '>', 180), FIVE_FIGHTS]),
+    BadgeRule('Pie-thon', [HAS_WINS, Condition('sub_wins_ratio', '>', 0.13), Condition('sub_att_per_fight', '>', 0.46), FIVE_FIGHTS]),
+    BadgeRule('Doughmaker', [HAS_WINS, Condition('ground_finish_rate', '>', 55), Condition('ground_landed_per_tko', '>', 15),
+                             Condition('ctrl_avg', '>', 150), FIVE_FIGHTS, Condition('ko_tko_wins', '>', 0, True)]),
+    BadgeRule('Kickin’ Pot Pie', [HAS_WINS, (Condition('leg_landed_avg', '>', 24.6), Condition('body_landed_avg', '>', 25.5)),
+                                  Condition('leg_body_landed_avg', '>', 50), Condition('ko_tko_wins', '>', 2), FIVE_FIGHTS]),
+    BadgeRule('Greasy', [Condition('td_def', '>', 82), Condition('td_attempts_received_avg', '<', 10)]),
+    BadgeRule('Can’t Touch This', [Condition('str_def', '>', 59), Condition('sapm', '<', 3.1), FIVE_FIGHTS]),
+    BadgeRule('Iron Chin', [Condition('kd_received_avg', '<', 0.15), Condition('ko_loss_rate', '<', 4), FIVE_FIGHTS]),
+    BadgeRule('Locksmith', [Condition('sub_att_received_total', '>=', 1), Condition('sub_att_received_total', '<=', 18),
+                            Condition('never_submitted', '==', 1, True), Condition('total_fights', '>=', 8, True)]),
+    BadgeRule('The Dogwalker', [FIVE_FIGHTS, Condition('fight_time_per_fight', '>', 160), Condition('sig_str_landed_per_sec', '>', 0.23)]),
+    BadgeRule('Champ Rounds', [Condition('five_round_fights', '>=', 1, True), Condition('five_round_win_rate', '>', 25),
+                               Condition('five_round_decision_rate', '>', 5), Condition('five_round_wins', '>=', 1, True)])
+]
+
+# One float array per stat and derived feature, over every fighter
+def badge_features(fighters_df):
+    features = {column: fighters_df[column].fillna(0).to_numpy(dtype=float) for column in STAT_COLUMNS}
+    for name, compute in DERIVED_FEATURES.items():
+        features[name] = compute(features)
+    return features
+
+def condition_mask(features, condition):
+    if isinstance(condition, Condition):
+        return OPERATORS[condition.op](features[condition.feature], condition.threshold)
+    return np.logical_or.reduce([condition_mask(features, alternative) for alternative in condition])
+
+def rule_mask(features, rule):
+    return np.logical_and.reduce([condition_mask(features, condition) for condition in rule.conditions])
+
+# Boolean frame with one column per badge, in rule order
+def evaluate_badges(features, rules=BADGE_RULES, index=None):
+    return pd.DataFrame({rule.name: rule_mask(features, rule) for rule in rules}, index=index)
+
+# Comma-separated badges per fighter in rule order, None for fighters without any
+def badge_lists(masks):
+    lists = pd.Series('', index=masks.index)
+    for name in masks.columns:
+        lists = lists + np.where(masks[name], name + ',', '')
+    return lists.str[:-1].where(lists != '', None)
+
+def badge_distribution(masks):
+    counts = masks.sum()
+    total = len(masks)
+    return pd.DataFrame({
+        'Badge': masks.columns,
+        'Count': counts.values,
+        # Python's round, as the per-badge report used
+        'Percentage': [round(count / total * 100, 2) if total > 0 else 0 for count in counts.tolist()]
+    })
@@ -1,65 +1,53 @@
 import pandas as pd
-import os
 import logging
+from .datastore import csv_path, dataset_exists, load_dataset, save_dataset
 
-# Setup logging
-logging.basicConfig(filename='combine_stats_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('combine_fighter_stats')
 
 def combine_fighter_stats():
     try:
-        # Load input CSVs
-        fighter_file = 'data/fighter_details.csv'
-        defensive_file = 'data/defensive_stats.csv'
-        derived_file = 'data/derived_stats.csv'
-        
-        if not os.path.exists(fighter_file):
-            logger.error(f"{fighter_file} not found")
-            print(f"Error: {fighter_file} not found")
+        # Load input datasets
+        if not dataset_exists('fighter_details'):
+            logger.error(f"{csv_path('fighter_details')} not found")
+            print(f"Error: {csv_path('fighter_details')} not found")
             return
-        fighters_df = pd.read_csv(fighter_file)
-        logger.info(f"Loaded {fighter_file} with {len(fighters_df)} fighters")
-        
-        if not os.path.exists(defensive_file):
-            logger.warning(f"{defensive_file} not found, creating empty DataFrame")
-            print(f"Warning: {defensive_file} not found, proceeding with partial data")
-            defensive_df = pd.DataFrame(columns=['id'])
-        else:
-            defensive_df = pd.read_csv(defensive_file)
-            logger.info(f"Loaded {defensive_file} with {len(defensive_df)} records")
+        fighters_df = load_dataset('fighter_details')
+        logger.info(f"Loaded fighter_details with {len(fighters_df)} fighters")
         
-        if not os.path.exists(derived_file):
-            logger.warning(f"{derived_file} not found, creating empty DataFrame")
-            print(f"Warning: {derived_file} not found, proceeding with partial data")
-            derived_df = pd.DataFrame(columns=['id'])
-        else:
-            derived_df = pd.read_csv(derived_file)
-            logger.info(f"Loaded {derived_file} with {len(derived_df)} records")
-        
-        # Ensure 'id' is string for consistent merging
-        fighters_df['id'] = fighters_df['id'].astype(str)
-        defensive_df['id'] = defensive_df['id'].astype(str)
-        derived_df['id'] = derived_df['id'].astype(str)
+        partial = {}
+        for name in ('defensive_stats', 'derived_stats'):
+            if not dataset_exists(name):
+                logger.warning(f"{csv_path(name)} not found, creating empty DataFrame")
+                print(f"Warning: {csv_path(name)} not found, proceeding with partial data")
+                partial[name] = pd.DataFrame({'id': pd.Series(dtype='str')})
+            else:
+                partial[name] = load_dataset(name)
+                logger.info(f"Loaded {name} with {len(partial[name])} records")
         
         # Merge with left joins to retain all fighters
-        combined_df = fighters_df.merge(defensive_df, on='id', how='left')
-        combined_df = combined_df.merge(derived_df, on='id', how='left')
+        combined_df = fighters_df.merge(partial['defensive_stats'], on='id', how='left')
+        combined_df = combined_df.merge(partial['derived_stats'], on='id', how='left')
         
-        # Fill NaN values with defaults (0 for numeric, empty string for others)
-        numeric_columns = combined_df.select_dtypes(include=['float64', 'int64']).columns
+        # Fill NaN values with defaults (0 for numeric, empty string for text); categorical
+        # and date columns stay missing, which the CSV writes as empty as well
+        numeric_columns = combined_df.select_dtypes(include='number').columns
         combined_df[numeric_columns] = combined_df[numeric_columns].fillna(0)
-        combined_df = combined_df.fillna('')
+        text_columns = combined_df.select_dtypes(include=['str', 'object']).columns
+        combined_df[text_columns] = combined_df[text_columns].fillna('')
         
-        # Save to CSV
-        output_file = 'data/fighters_stats.csv'
-        combined_df.to_csv(output_file, index=False)
-        logger.info(f"Generated {output_file} for {len(combined_df)} fighters")
-        print(f"Generated {output_file} for {len(combined_df)} fighters")
+        # Save to the store and the CSV snapshot
+        combined_df = save_dataset('fighters_stats', combined_df)
+        logger.info(f"Generated fighters_stats for {len(combined_df)} fighters")
+        print(f"Generated {csv_path('fighters_stats')} for {len(combined_df)} fighters")
     
     except Exception as e:
         logger.error(f"Failed to combine fighter stats: {str(e)}")
         print(f"Failed to combine fighter stats: {str(e)}")
         raise
 
+def main(argv=None):
+    logging.basicConfig(filename='combine_stats_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    combine_fighter_stats()
+
 if __name__ == '__main__':
-    combine_fighter_stats()
\ No newline at end of file
+    main()
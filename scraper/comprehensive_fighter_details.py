@@ -1,17 +1,12 @@
-import pandas as pd
-import os
-import csv
+from .datastore import csv_path, dataset_exists, load_dataset, save_dataset
 
 def generate_comprehensive_fighter_details():
     try:
-        fighters_file = 'data/fighters_stats.csv'
-        badges_file = 'data/badges.csv'
-        
-        if not os.path.exists(fighters_file) or not os.path.exists(badges_file):
+        if not dataset_exists('fighters_stats') or not dataset_exists('badges'):
             raise FileNotFoundError("Required files not found: fighters_stats.csv or badges.csv")
         
-        fighters_df = pd.read_csv(fighters_file)
-        badges_df = pd.read_csv(badges_file)[['id', 'badges']]
+        fighters_df = load_dataset('fighters_stats')
+        badges_df = load_dataset('badges', ['id', 'badges'])
         
         # Merge on 'id', keeping all fighters (left join)
         comprehensive_df = fighters_df.merge(badges_df, on='id', how='left')
@@ -19,14 +14,16 @@ def generate_comprehensive_fighter_details():
         # Replace NaN in 'badges' with empty string for fighters with no badges
         comprehensive_df['badges'] = comprehensive_df['badges'].fillna('')
         
-        # Save to CSV
-        output_file = 'data/comprehensive_fighter_details.csv'
-        comprehensive_df.to_csv(output_file, quoting=csv.QUOTE_ALL, index=False)
-        print(f"Generated {output_file} with {len(comprehensive_df)} fighters.")
+        # Save to the store and the CSV snapshot, written with QUOTE_ALL
+        save_dataset('comprehensive_fighter_details', comprehensive_df)
+        print(f"Generated {csv_path('comprehensive_fighter_details')} with {len(comprehensive_df)} fighters.")
     
     except Exception as e:
         print(f"Failed to generate comprehensive fighter details: {str(e)}")
         raise
 
+def main(argv=None):
+    generate_comprehensive_fighter_details()
+
 if __name__ == '__main__':
-    generate_comprehensive_fighter_details()
\ No newline at end of file
+    main()
@@ -0,0 +1,291 @@
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+from collections import namedtuple
+
+import pandas as pd
+
+from .parsing import EVENT_DATE_FORMAT, FIGHT_STAT_FIELDS
+
+logger = logging.getLogger('datastore')
+
+DATA_DIR = 'data'
+# Typed Parquet copy of every dataset, kept in the Actions cache between runs; the CSVs in
+# data/ are the git-visible snapshots
+STORE_DIR = os.path.join('.cache', 'store')
+# SCRAPER_CSV_EXPORT=0 saves to the store only; `python -m scraper export` then writes the
+# pending CSV snapshots in one go
+CSV_EXPORT = os.environ.get('SCRAPER_CSV_EXPORT', '1') != '0'
+
+# Column kinds. COUNT is for integer-valued stats, which float32 holds exactly; rates and
+# percentages stay float64 so threshold comparisons see the same values as the CSV
+ID = 'str'
+TEXT = 'str'
+CATEGORY = 'category'
+COUNT = 'float32'
+FLOAT = 'float64'
+INT = 'Int64'
+DATE = 'datetime64[ns]'
+
+# A dataset is data/<name>.csv and .cache/store/<name>.parquet. Columns not in the schema
+# keep the dtype they arrive with; date_format is how DATE columns are written in the CSV
+Dataset = namedtuple('Dataset', ['name', 'schema', 'date_format', 'quoting'], defaults=[None, csv.QUOTE_MINIMAL])
+
+def _fight_stat_schema():
+    schema = {}
+    for corner in ('r', 'b'):
+        for field in FIGHT_STAT_FIELDS:
+            if field.kind == 'x_of_y':
+                schema[f"{corner}_{field.column}_landed"] = COUNT
+                schema[f"{corner}_{field.column}_atmpted"] = COUNT
+            elif field.kind == 'count':
+                schema[f"{corner}_{field.column}"] = COUNT
+            elif field.kind == 'mm:ss':
+                schema[f"{corner}_{field.column}"] = INT
+            else:
+                schema[f"{corner}_{field.column}"] = FLOAT
+    return schema
+
+FIGHTER_SCHEMA = {
+    'id': ID, 'name': TEXT, 'nick_name': TEXT, 'wins': INT, 'losses': INT, 'draws': INT,
+    'height': FLOAT, 'weight': FLOAT, 'reach': FLOAT, 'stance': CATEGORY, 'dob': DATE,
+    'splm': FLOAT, 'str_acc': INT, 'sapm': FLOAT, 'str_def': INT, 'td_avg': FLOAT,
+    'td_avg_acc': INT, 'td_def': INT, 'sub_avg': FLOAT
+}
+DEFENSIVE_SCHEMA = {
+    'id': ID, 'kd_received_avg': FLOAT, 'td_attempts_received_avg': FLOAT, 'sub_att_received_avg': FLOAT, 'sub_def': FLOAT
+}
+DERIVED_SCHEMA = {
+    'id': ID, 'total_fights': INT, 'total_fight_time_sec': INT, 'finish_rate': FLOAT, 'ctrl_avg': FLOAT,
+    'leg_landed_avg': FLOAT, 'body_landed_avg': FLOAT, 'kd': COUNT, 'strikes_attempted': COUNT, 'sub_att': COUNT,
+    'career_td_acc': FLOAT, 'ko_tko_wins': INT, 'sub_wins': INT, 'ko_loss_rate': FLOAT, 'never_submitted': INT,
+    'five_round_fights': INT, 'five_round_wins': INT, 'five_round_win_rate': FLOAT, 'five_round_decision_rate': FLOAT,
+    'ground_finish_rate': FLOAT, 'ground_landed_per_tko': FLOAT, 'sig_str_landed_per_sec': FLOAT, 'splm_std': FLOAT
+}
+FIGHTERS_STATS_SCHEMA = {**FIGHTER_SCHEMA, **DEFENSIVE_SCHEMA, **DERIVED_SCHEMA}
+BOUT_SCHEMA = {
+    'event_name': TEXT, 'event_id': ID, 'fight_id': ID, 'r_name': TEXT, 'r_id': ID, 'b_name': TEXT, 'b_id': ID,
+    'division': CATEGORY, 'title_fight': INT
+}
+
+DATASETS = {dataset.name: dataset for dataset in [
+    Dataset('event_details', {'event_id': ID, 'fight_id': ID, 'date': DATE, 'location': TEXT, 'winner': TEXT, 'winner_id': ID},
+            EVENT_DATE_FORMAT),
+    Dataset('fight_details', {**BOUT_SCHEMA, 'method': CATEGORY, 'finish_round': INT, 'match_time_sec': INT,
+                              'total_rounds': INT, 'referee': CATEGORY, 'date': DATE, **_fight_stat_schema()}, '%Y/%m/%d'),
+    Dataset('fighter_details', FIGHTER_SCHEMA, '%b %d, %Y'),
+    Dataset('defensive_stats', DEFENSIVE_SCHEMA),
+    Dataset('derived_stats', DERIVED_SCHEMA),
+    Dataset('fighters_stats', FIGHTERS_STATS_SCHEMA, '%b %d, %Y'),
+    Dataset('badges', {'id': ID, 'badges': TEXT}, None, csv.QUOTE_ALL),
+    Dataset('badge_distribution', {'Badge': TEXT, 'Count': INT, 'Percentage': FLOAT}),
+    Dataset('comprehensive_fighter_details', {**FIGHTERS_STATS_SCHEMA, 'badges': TEXT}, '%b %d, %Y', csv.QUOTE_ALL),
+    Dataset('upcoming_event_details', {'event_id': ID, 'event_name': TEXT, 'date': DATE, 'location': TEXT}, EVENT_DATE_FORMAT),
+    Dataset('upcoming_fight_details', BOUT_SCHEMA)
+]}
+
+# Frames loaded in this process: name -> Memo(file version, frame, whether it has every column)
+Memo = namedtuple('Memo', ['version', 'frame', 'complete'])
+_memo = {}
+
+def csv_path(name):
+    return os.path.join(DATA_DIR, f"{name}.csv")
+
+def store_path(name):
+    return os.path.join(STORE_DIR, f"{name}.parquet")
+
+def _meta_path(name):
+    return os.path.join(STORE_DIR, f"{name}.json")
+
+# Casts the schema's columns; used on CSV import and before every save
+def apply_schema(df, dataset):
+    df = df.copy()
+    for column, dtype in dataset.schema.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if dtype == DATE:
+            df[column] = pd.to_datetime(df[column], format=dataset.date_format, errors='coerce').astype(DATE)
+        elif dtype == INT:
+            df[column] = pd.to_numeric(df[column]).astype(INT)
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+def _read_csv(dataset, columns=None):
+    text_columns = {column: TEXT for column, dtype in dataset.schema.items() if dtype in (TEXT, CATEGORY)}
+    df = pd.read_csv(csv_path(dataset.name), dtype=text_columns, usecols=columns)
+    return apply_schema(df, dataset)
+
+def _csv_signature(name, with_hash=True):
+    path = csv_path(name)
+    stat = os.stat(path)
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        with open(path, 'rb') as f:
+            signature['sha1'] = hashlib.sha1(f.read()).hexdigest()
+    return signature
+
+def _read_meta(name):
+    try:
+        with open(_meta_path(name), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_meta(name, exported):
+    meta = {'csv': _csv_signature(name) if os.path.exists(csv_path(name)) else None, 'exported': exported}
+    with open(_meta_path(name), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+# True when the store holds the newest copy of the dataset: the CSV is missing or is the one
+# last imported or exported. A checkout changes mtimes, so an unchanged size falls back to the hash
+def _store_is_current(name):
+    if not os.path.exists(store_path(name)):
+        return False
+    if not os.path.exists(csv_path(name)):
+        return True
+    meta = _read_meta(name)
+    if meta is None or meta['csv'] is None:
+        return False
+    signature = _csv_signature(name, with_hash=False)
+    if signature['mtime_ns'] == meta['csv']['mtime_ns'] and signature['size'] == meta['csv']['size']:
+        return True
+    if signature['size'] != meta['csv']['size'] or _csv_signature(name)['sha1'] != meta['csv']['sha1']:
+        return False
+    _write_meta(name, meta['exported'])
+    return True
+
+def _write_store(name, df):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp_path = store_path(name) + '.tmp'
+    try:
+        df.to_parquet(tmp_path, index=False)
+    except ImportError as e:
+        logger.warning(f"Not storing {name}, no parquet engine available: {str(e)}")
+        return False
+    os.replace(tmp_path, store_path(name))
+    return True
+
+def _import_csv(dataset):
+    df = _read_csv(dataset)
+    if _write_store(dataset.name, df):
+        _write_meta(dataset.name, exported=True)
+        logger.info(f"Imported {len(df)} rows of {csv_path(dataset.name)} into the store.")
+    return df
+
+def dataset_exists(name):
+    return os.path.exists(store_path(name)) or os.path.exists(csv_path(name))
+
+def _read_dataset(dataset, columns=None):
+    name = dataset.name
+    if not _store_is_current(name):
+        if not os.path.exists(csv_path(name)):
+            raise FileNotFoundError(f"Dataset not found: {csv_path(name)}")
+        df = _import_csv(dataset)
+        return df if columns is None else df[columns]
+    try:
+        return pd.read_parquet(store_path(name), columns=columns, memory_map=True)
+    except (ImportError, OSError, ValueError) as e:
+        logger.warning(f"Reading {csv_path(name)}, store unreadable: {str(e)}")
+        return _read_csv(dataset, columns)
+
+# mtime and size of the stored copy and of the CSV; any write to either changes it
+def _file_version(name):
+    version = []
+    for path in (store_path(name), csv_path(name)):
+        try:
+            stat = os.stat(path)
+            version.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            version.append(None)
+    return tuple(version)
+
+def _remember(name, df, complete):
+    _memo[name] = Memo(_file_version(name), df, complete)
+
+def forget(name=None):
+    if name is None:
+        _memo.clear()
+    else:
+        _memo.pop(name, None)
+
+# Typed frame of a dataset; columns= projects the read. Frames are memoized per process and
+# reused until the stored copy or the CSV changes on disk; a projection missing from the memo
+# is read together with the columns already held. The store is memory-mapped, and
+# re-imported from the CSV first when the CSV changed outside the store
+def load_dataset(name, columns=None):
+    dataset = DATASETS[name]
+    cached = _memo.get(name)
+    if cached is not None and cached.version != _file_version(name):
+        cached = None
+    if cached is not None and (cached.complete or (columns is not None and set(columns) <= set(cached.frame.columns))):
+        df = cached.frame
+    elif columns is None:
+        df = _read_dataset(dataset)
+        _remember(name, df, complete=True)
+    else:
+        wanted = list(dict.fromkeys((list(cached.frame.columns) if cached is not None else []) + list(columns)))
+        df = _read_dataset(dataset, wanted)
+        _remember(name, df, complete=False)
+    return df.copy(deep=False) if columns is None else df[list(columns)]
+
+# Changes whenever the dataset's stored copy does; lets derived caches detect stale inputs
+def dataset_version(name):
+    if not _store_is_current(name) and os.path.exists(csv_path(name)):
+        _import_csv(DATASETS[name])
+    stat = os.stat(store_path(name) if os.path.exists(store_path(name)) else csv_path(name))
+    return [stat.st_mtime_ns, stat.st_size]
+
+def _write_csv(dataset, df):
+    tmp_path = csv_path(dataset.name) + '.tmp'
+    df.to_csv(tmp_path, index=False, quoting=dataset.quoting, date_format=dataset.date_format)
+    os.replace(tmp_path, csv_path(dataset.name))
+
+# Saves a dataset in full with its schema applied; the CSV snapshot is written when export
+# (CSV_EXPORT by default) is set or the store cannot be written
+def save_dataset(name, df, export=None):
+    dataset = DATASETS[name]
+    df = apply_schema(df, dataset)
+    stored = _write_store(name, df)
+    export = CSV_EXPORT if export is None else export
+    if export or not stored:
+        _write_csv(dataset, df)
+    if stored:
+        _write_meta(name, exported=export)
+    _remember(name, df, complete=True)
+    return df
+
+# Writes the CSV snapshot of every dataset saved without one (every stored dataset with all_datasets)
+def export_datasets(names=None, all_datasets=False):
+    exported = []
+    for name in names or DATASETS:
+        if not os.path.exists(store_path(name)):
+            continue
+        if not _store_is_current(name):
+            logger.warning(f"Not exporting {name}, {csv_path(name)} changed since it was stored.")
+            continue
+        if _read_meta(name)['exported'] and os.path.exists(csv_path(name)) and not all_datasets:
+            continue
+        _write_csv(DATASETS[name], load_dataset(name))
+        _write_meta(name, exported=True)
+        exported.append(name)
+    return exported
+
+def main(argv=None):
+    logging.basicConfig(filename='datastore_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Write the CSV snapshots in data/ from the typed store')
+    parser.add_argument('datasets', nargs='*', metavar='DATASET', help=f"datasets to export (default: all of {', '.join(DATASETS)})")
+    parser.add_argument('--all', action='store_true', help='rewrite snapshots that are already up to date')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.datasets if name not in DATASETS]
+    if unknown:
+        parser.error(f"unknown datasets: {', '.join(unknown)}")
+    exported = export_datasets(args.datasets, all_datasets=args.all)
+    logger.info(f"Exported {len(exported)} datasets: {', '.join(exported) or 'none'}")
+    print(f"Exported {len(exported)} CSV snapshots{': ' + ', '.join(exported) if exported else ''}")
+
+if __name__ == '__main__':
+    main()
@@ -1,71 +1,104 @@
 import pandas as pd
+import argparse
 import logging
+import sys
+from .appearances import load_appearances
+from .datastore import dataset_exists, save_dataset
+from .fighter_accumulators import FighterAccumulator, compare_stats, merge_stats_dataset
 
-logging.basicConfig(filename='defensive_stats_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('defensive_stats')
 
-def calculate_defensive_stats():
-    try:
-        fight_df = pd.read_csv('data/fight_details.csv')
-        event_df = pd.read_csv('data/event_details.csv')
-        fight_df = fight_df.merge(event_df[['fight_id', 'winner_id']], on='fight_id', how='left')
-        fighter_ids = pd.concat([fight_df['r_id'], fight_df['b_id']]).unique()
-        defensive_stats = []
+OUTPUT_DATASET = 'defensive_stats'
+# Opponent stats received by each fighter (opp_<stat> in the appearance table)
+RECEIVED_STATS = ['kd', 'td_atmpted', 'sub_att']
+APPEARANCE_COLUMNS = ['fight_id', 'corner', 'own_id', 'match_time_sec', 'method_category', 'won'] + [f"opp_{stat}" for stat in RECEIVED_STATS]
+# More takedown attempts than this in one fight usually means a parsing problem upstream
+SUSPICIOUS_TD_ATTEMPTS = 10
 
-        for fid in fighter_ids:
-            r_fights = fight_df[fight_df['r_id'] == fid]
-            b_fights = fight_df[fight_df['b_id'] == fid]
-            total_fight_time_sec = 0
-            kd_received = 0
-            td_attempts_received = 0
-            sub_att_received = 0
-            sub_def = 0
+# One warning for the whole table instead of one per fight
+def report_suspicious_td_attempts(appearances):
+    suspicious = appearances[appearances['opp_td_atmpted'] > SUSPICIOUS_TD_ATTEMPTS]
+    if suspicious.empty:
+        return
+    worst = suspicious.sort_values('opp_td_atmpted', ascending=False).head(10)
+    examples = ", ".join(f"{fight_id} ({'b' if corner == 'r' else 'r'}_td_atmpted={attempts:g})"
+                         for fight_id, corner, attempts in zip(worst['fight_id'], worst['corner'], worst['opp_td_atmpted']))
+    logger.warning(f"Suspicious TD attempts (> {SUSPICIOUS_TD_ATTEMPTS}) in {suspicious['fight_id'].nunique()} fights, "
+                   f"{len(suspicious)} corners. Highest: {examples}")
 
-            for _, row in r_fights.iterrows():
-                total_fight_time_sec += row['match_time_sec']
-                kd_received += row['b_kd'] if pd.notnull(row['b_kd']) else 0
-                td_attempts = row['b_td_atmpted'] if pd.notnull(row['b_td_atmpted']) else 0
-                if td_attempts > 10:
-                    logger.warning(f"Suspicious b_td_atmpted: {td_attempts} for fight_id {row['fight_id']}")
-                td_attempts_received += td_attempts
-                sub_att_received += row['b_sub_att'] if pd.notnull(row['b_sub_att']) else 0
-                if row['method'].lower() != 'submission' or row['winner_id'] == fid:
-                    sub_def += row['b_sub_att'] if pd.notnull(row['b_sub_att']) else 0
+# Additive per-appearance values, summed per fighter
+def appearance_contributions(appearances):
+    received = appearances[[f"opp_{stat}" for stat in RECEIVED_STATS]].set_axis(RECEIVED_STATS, axis=1).fillna(0)
+    # Submission attempts survived: all of them unless the fighter was submitted
+    survived = (appearances['method_category'] != 'submission') | appearances['won']
+    received['sub_def'] = received['sub_att'].where(survived, 0)
+    received['match_time_sec'] = appearances['match_time_sec']
+    received['time_missing'] = appearances['match_time_sec'].isna().astype(int)
+    return received
 
-            for _, row in b_fights.iterrows():
-                total_fight_time_sec += row['match_time_sec']
-                kd_received += row['r_kd'] if pd.notnull(row['r_kd']) else 0
-                td_attempts = row['r_td_atmpted'] if pd.notnull(row['r_td_atmpted']) else 0
-                if td_attempts > 10:
-                    logger.warning(f"Suspicious r_td_atmpted: {td_attempts} for fight_id {row['fight_id']}")
-                td_attempts_received += td_attempts
-                sub_att_received += row['r_sub_att'] if pd.notnull(row['r_sub_att']) else 0
-                if row['method'].lower() != 'submission' or row['winner_id'] == fid:
-                    sub_def += row['r_sub_att'] if pd.notnull(row['r_sub_att']) else 0
+accumulator = FighterAccumulator('defensive', appearance_contributions, APPEARANCE_COLUMNS, output=OUTPUT_DATASET)
 
-            if total_fight_time_sec > 0:
-                minutes = total_fight_time_sec / 60
-                kd_received_avg = (kd_received / minutes) * 15
-                td_attempts_received_avg = (td_attempts_received / minutes) * 15
-                sub_att_received_avg = (sub_att_received / minutes) * 15
-                sub_def = (sub_def / (sub_att_received or 1)) * 100
-            else:
-                kd_received_avg = td_attempts_received_avg = sub_att_received_avg = sub_def = 0
+def _round(series, digits=2):
+    # Python's round, as used when these stats were computed per fighter
+    return series.map(lambda value: round(value, digits))
 
-            defensive_stats.append({
-                'id': fid,
-                'kd_received_avg': round(kd_received_avg, 2),
-                'td_attempts_received_avg': round(td_attempts_received_avg, 2),
-                'sub_att_received_avg': round(sub_att_received_avg, 2),
-                'sub_def': round(sub_def, 2)
-            })
+# defensive_stats.csv rows for the fighters in the index of totals
+def stats_from_totals(totals):
+    # A fight without a recorded time leaves the fighter's total time undefined
+    total_time = totals['match_time_sec'].mask(totals['time_missing'] > 0)
+    timed = total_time > 0
+    minutes = total_time.where(timed) / 60
+    sub_att_received = totals['sub_att'].where(totals['sub_att'] != 0, 1)
+    df = pd.DataFrame({
+        'id': totals.index,
+        'kd_received_avg': (totals['kd'] / minutes * 15).where(timed, 0).values,
+        'td_attempts_received_avg': (totals['td_atmpted'] / minutes * 15).where(timed, 0).values,
+        'sub_att_received_avg': (totals['sub_att'] / minutes * 15).where(timed, 0).values,
+        'sub_def': (totals['sub_def'] / sub_att_received * 100).where(timed, 0).values
+    })
+    for column in ['kd_received_avg', 'td_attempts_received_avg', 'sub_att_received_avg', 'sub_def']:
+        df[column] = _round(df[column])
+    return df
 
-        df = pd.DataFrame(defensive_stats)
-        df.to_csv('data/defensive_stats.csv', index=False)
+# Same incremental scheme as calculate_derived_stats
+def calculate_defensive_stats(full=False, verify=False):
+    try:
+        appearances = load_appearances(APPEARANCE_COLUMNS)
+        fighter_ids = appearances['own_id'].unique()
+        report_suspicious_td_attempts(appearances)
+        totals, affected, folded = accumulator.update(appearances, full=full)
+        df = None
+        if affected is not None and dataset_exists(OUTPUT_DATASET):
+            try:
+                df = merge_stats_dataset(OUTPUT_DATASET, stats_from_totals(totals.loc[totals.index.intersection(list(affected))]), fighter_ids)
+                logger.info(f"Updated defensive stats for {len(affected)} fighters.")
+            except KeyError as e:
+                logger.warning(f"Recomputing every fighter's defensive stats: {str(e)}")
+        if df is None:
+            # Fighter ids that never match a corner (missing ids) still get an all-zero row
+            df = stats_from_totals(totals.reindex(fighter_ids, fill_value=0))
+        save_dataset(OUTPUT_DATASET, df)
+        accumulator.save(totals, folded)
         logger.info(f"Generated defensive_stats.csv for {len(fighter_ids)} fighters.")
         print(f"Generated defensive_stats.csv for {len(fighter_ids)} fighters.")
+        if verify:
+            expected = stats_from_totals(accumulator.fold(appearances).reindex(fighter_ids, fill_value=0))
+            return compare_stats(expected, df, 'defensive_stats.csv')
+        return 0
     except Exception as e:
         logger.error(f"Failed to calculate defensive stats: {str(e)}")
         raise
 
-calculate_defensive_stats()
\ No newline at end of file
+def main(argv=None):
+    logging.basicConfig(filename='defensive_stats_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Calculate defensive stats per fighter from fight_details.csv')
+    parser.add_argument('--full', action='store_true', help='rebuild the per-fighter totals from every fight instead of folding in new ones')
+    parser.add_argument('--verify', action='store_true', help='compare the result against a full recompute and exit non-zero on any difference')
+    args = parser.parse_args(argv)
+    mismatches = calculate_defensive_stats(full=args.full, verify=args.verify)
+    if mismatches:
+        print(f"defensive_stats.csv differs from a full recompute in {mismatches} cells, see defensive_stats_log.txt", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
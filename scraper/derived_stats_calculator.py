@@ -1,151 +1,136 @@
 import pandas as pd
-import numpy as np
+import argparse
 import logging
+import sys
+from .appearances import load_appearances
+from .datastore import dataset_exists, save_dataset
+from .fighter_accumulators import FighterAccumulator, compare_stats, merge_stats_dataset
 
-logging.basicConfig(filename='derived_stats_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('derived_stats')
 
-def calculate_derived_stats():
-    try:
-        fight_df = pd.read_csv('data/fight_details.csv')
-        event_df = pd.read_csv('data/event_details.csv')
-        fight_df = fight_df.merge(event_df[['fight_id', 'winner_id']], on='fight_id', how='left')
-        fighter_ids = pd.concat([fight_df['r_id'], fight_df['b_id']]).unique()
-        derived_stats = []
+OUTPUT_DATASET = 'derived_stats'
+# Fighter's own per-fight stats (own_<stat> in the appearance table); missing counts are treated as zero
+SUMMED_STATS = ['ctrl', 'kd', 'sig_str_atmpted', 'sub_att', 'leg_landed', 'body_landed',
+                'td_landed', 'td_atmpted', 'sig_str_landed']
+APPEARANCE_COLUMNS = ['fight_id', 'corner', 'own_id', 'match_time_sec', 'total_rounds', 'method_category', 'won',
+                      'own_ground_landed'] + [f"own_{stat}" for stat in SUMMED_STATS]
 
-        for fid in fighter_ids:
-            r_fights = fight_df[fight_df['r_id'] == fid]
-            b_fights = fight_df[fight_df['b_id'] == fid]
-            total_fights = len(r_fights) + len(b_fights)
-            total_fight_time_sec = 0
-            ko_tko_wins = sub_wins = 0
-            five_round_fights = five_round_wins = five_round_decision_wins = 0
-            ko_losses = sub_losses = 0
-            ground_ko_tko_wins = ground_landed_tko = 0
-            ctrl_time = kd = strikes_attempted = sub_att = 0
-            leg_landed = body_landed = td_landed = td_attempted = 0
-            sig_str_landed_total = 0
-            splm_per_fight = []
+# Additive per-appearance values; splm is accumulated as a running mean/variance for splm_std
+def appearance_contributions(appearances):
+    won = appearances['won']
+    method = appearances['method_category']
+    is_ko = method == 'ko_tko'
+    is_sub = method == 'submission'
+    ko_win = won & is_ko
+    ground_ko_win = ko_win & (appearances['own_ground_landed'] > 0)
+    # Only title and main event wins count as five-round fights
+    five_round_win = won & (appearances['total_rounds'] == 5)
+    minutes = appearances['match_time_sec'] / 60
+    values = pd.DataFrame({
+        'total_fights': 1,
+        'ko_tko_wins': ko_win.astype(int),
+        'sub_wins': (won & is_sub).astype(int),
+        'five_round_wins': five_round_win.astype(int),
+        'five_round_decision_wins': (five_round_win & (method == 'decision')).astype(int),
+        'ko_losses': (~won & is_ko).astype(int),
+        'sub_losses': (~won & is_sub).astype(int),
+        'ground_ko_tko_wins': ground_ko_win.astype(int),
+        'ground_landed_tko': appearances['own_ground_landed'].where(ground_ko_win, 0),
+        'time_missing': appearances['match_time_sec'].isna().astype(int),
+        'match_time_sec': appearances['match_time_sec']
+    }, index=appearances.index)
+    stats = appearances[[f"own_{stat}" for stat in SUMMED_STATS]].set_axis(SUMMED_STATS, axis=1).fillna(0)
+    values = values.join(stats)
+    values['splm'] = (stats['sig_str_landed'] / minutes.where(minutes > 0)).fillna(0)
+    return values
 
-            for _, row in r_fights.iterrows():
-                total_fight_time_sec += row['match_time_sec']
-                if row['winner_id'] == fid:
-                    if 'ko' in row['method'].lower():
-                        ko_tko_wins += 1
-                        if row['r_ground_landed'] > 0:
-                            ground_ko_tko_wins += 1
-                            ground_landed_tko += row['r_ground_landed']
-                    if 'submission' in row['method'].lower():
-                        sub_wins += 1
-                    if row['total_rounds'] == 5:
-                        five_round_fights += 1
-                        five_round_wins += 1
-                        if 'decision' in row['method'].lower():
-                            five_round_decision_wins += 1
-                else:
-                    if 'ko' in row['method'].lower():
-                        ko_losses += 1
-                    if 'submission' in row['method'].lower():
-                        sub_losses += 1
-                ctrl_time += row['r_ctrl'] if pd.notnull(row['r_ctrl']) else 0
-                kd += row['r_kd'] if pd.notnull(row['r_kd']) else 0
-                strikes_attempted += row['r_sig_str_atmpted'] if pd.notnull(row['r_sig_str_atmpted']) else 0
-                sub_att += row['r_sub_att'] if pd.notnull(row['r_sub_att']) else 0
-                leg_landed += row['r_leg_landed'] if pd.notnull(row['r_leg_landed']) else 0
-                body_landed += row['r_body_landed'] if pd.notnull(row['r_body_landed']) else 0
-                td_landed += row['r_td_landed'] if pd.notnull(row['r_td_landed']) else 0
-                td_attempted += row['r_td_atmpted'] if pd.notnull(row['r_td_atmpted']) else 0
-                sig_str_landed = row['r_sig_str_landed'] if pd.notnull(row['r_sig_str_landed']) else 0
-                sig_str_landed_total += sig_str_landed
-                minutes = row['match_time_sec'] / 60
-                splm = (sig_str_landed / minutes) if minutes > 0 else 0
-                splm_per_fight.append(splm)
+accumulator = FighterAccumulator('derived', appearance_contributions, APPEARANCE_COLUMNS, welford=['splm'], output=OUTPUT_DATASET)
 
-            for _, row in b_fights.iterrows():
-                total_fight_time_sec += row['match_time_sec']
-                if row['winner_id'] == fid:
-                    if 'ko' in row['method'].lower():
-                        ko_tko_wins += 1
-                        if row['b_ground_landed'] > 0:
-                            ground_ko_tko_wins += 1
-                            ground_landed_tko += row['b_ground_landed']
-                    if 'submission' in row['method'].lower():
-                        sub_wins += 1
-                    if row['total_rounds'] == 5:
-                        five_round_fights += 1
-                        five_round_wins += 1
-                        if 'decision' in row['method'].lower():
-                            five_round_decision_wins += 1
-                else:
-                    if 'ko' in row['method'].lower():
-                        ko_losses += 1
-                    if 'submission' in row['method'].lower():
-                        sub_losses += 1
-                ctrl_time += row['b_ctrl'] if pd.notnull(row['b_ctrl']) else 0
-                kd += row['b_kd'] if pd.notnull(row['b_kd']) else 0
-                strikes_attempted += row['b_sig_str_atmpted'] if pd.notnull(row['b_sig_str_atmpted']) else 0
-                sub_att += row['b_sub_att'] if pd.notnull(row['b_sub_att']) else 0
-                leg_landed += row['b_leg_landed'] if pd.notnull(row['b_leg_landed']) else 0
-                body_landed += row['b_body_landed'] if pd.notnull(row['b_body_landed']) else 0
-                td_landed += row['b_td_landed'] if pd.notnull(row['b_td_landed']) else 0
-                td_attempted += row['b_td_atmpted'] if pd.notnull(row['b_td_atmpted']) else 0
-                sig_str_landed = row['b_sig_str_landed'] if pd.notnull(row['b_sig_str_landed']) else 0
-                sig_str_landed_total += sig_str_landed
-                minutes = row['match_time_sec'] / 60
-                splm = (sig_str_landed / minutes) if minutes > 0 else 0
-                splm_per_fight.append(splm)
+def _rate(numerator, denominator, scale=100):
+    return (numerator / denominator.where(denominator > 0) * scale).fillna(0)
 
-            if total_fight_time_sec > 0:
-                minutes = total_fight_time_sec / 60
-                finish_rate = ((ko_tko_wins + sub_wins) / total_fights) * 100
-                ctrl_avg = (ctrl_time / minutes) * 15
-                leg_landed_avg = (leg_landed / minutes) * 15
-                body_landed_avg = (body_landed / minutes) * 15
-                career_td_acc = (td_landed / td_attempted * 100) if td_attempted > 0 else 0
-                ko_loss_rate = (ko_losses / total_fights) * 100 if total_fights > 0 else 0
-                five_round_win_rate = (five_round_wins / five_round_fights * 100) if five_round_fights > 0 else 0
-                five_round_decision_rate = (five_round_decision_wins / five_round_wins * 100) if five_round_wins > 0 else 0
-                ground_finish_rate = (ground_ko_tko_wins / ko_tko_wins * 100) if ko_tko_wins > 0 else 0
-                ground_landed_per_tko = (ground_landed_tko / ko_tko_wins) if ko_tko_wins > 0 else 0
-                sig_str_landed_per_sec = sig_str_landed_total / total_fight_time_sec if total_fight_time_sec > 0 else 0
-                splm_std = np.std(splm_per_fight) if len(splm_per_fight) > 0 else 0
-            else:
-                finish_rate = ctrl_avg = leg_landed_avg = body_landed_avg = career_td_acc = 0
-                ko_loss_rate = five_round_win_rate = five_round_decision_rate = ground_finish_rate = 0
-                ground_landed_per_tko = sig_str_landed_per_sec = splm_std = 0
+def _round(series, digits=2):
+    # Python's round, as used when these stats were computed per fighter
+    return series.map(lambda value: round(value, digits))
 
-            derived_stats.append({
-                'id': fid,
-                'total_fights': total_fights,
-                'total_fight_time_sec': total_fight_time_sec,
-                'finish_rate': round(finish_rate, 2),
-                'ctrl_avg': round(ctrl_avg, 2),
-                'leg_landed_avg': round(leg_landed_avg, 2),
-                'body_landed_avg': round(body_landed_avg, 2),
-                'kd': kd,
-                'strikes_attempted': strikes_attempted,
-                'sub_att': sub_att,
-                'career_td_acc': round(career_td_acc, 2),
-                'ko_tko_wins': ko_tko_wins,
-                'sub_wins': sub_wins,
-                'ko_loss_rate': round(ko_loss_rate, 2),
-                'never_submitted': 1 if sub_losses == 0 else 0,
-                'five_round_fights': five_round_fights,
-                'five_round_wins': five_round_wins,
-                'five_round_win_rate': round(five_round_win_rate, 2),
-                'five_round_decision_rate': round(five_round_decision_rate, 2),
-                'ground_finish_rate': round(ground_finish_rate, 2),
-                'ground_landed_per_tko': round(ground_landed_per_tko, 2),
-                'sig_str_landed_per_sec': round(sig_str_landed_per_sec, 4),
-                'splm_std': round(splm_std, 2)
-            })
+# derived_stats.csv rows for the fighters in the index of totals
+def stats_from_totals(totals):
+    # A fight without a recorded time leaves the fighter's total time undefined
+    total_time = totals['match_time_sec'].mask(totals['time_missing'] > 0)
+    timed = total_time > 0
+    minutes = total_time / 60
+    derived = pd.DataFrame({
+        'id': totals.index,
+        'total_fights': totals['total_fights'].values,
+        'total_fight_time_sec': total_time.values,
+        'finish_rate': _rate(totals['ko_tko_wins'] + totals['sub_wins'], totals['total_fights']).where(timed, 0).values,
+        'ctrl_avg': _rate(totals['ctrl'], minutes, 15).where(timed, 0).values,
+        'leg_landed_avg': _rate(totals['leg_landed'], minutes, 15).where(timed, 0).values,
+        'body_landed_avg': _rate(totals['body_landed'], minutes, 15).where(timed, 0).values,
+        'kd': totals['kd'].values,
+        'strikes_attempted': totals['sig_str_atmpted'].values,
+        'sub_att': totals['sub_att'].values,
+        'career_td_acc': _rate(totals['td_landed'], totals['td_atmpted']).where(timed, 0).values,
+        'ko_tko_wins': totals['ko_tko_wins'].values,
+        'sub_wins': totals['sub_wins'].values,
+        'ko_loss_rate': _rate(totals['ko_losses'], totals['total_fights']).where(timed, 0).values,
+        'never_submitted': (totals['sub_losses'] == 0).astype(int).values,
+        'five_round_fights': totals['five_round_wins'].values,
+        'five_round_wins': totals['five_round_wins'].values,
+        # Wins are the only five-round fights counted, so this is 100 whenever there are any
+        'five_round_win_rate': _rate(totals['five_round_wins'], totals['five_round_wins']).where(timed, 0).values,
+        'five_round_decision_rate': _rate(totals['five_round_decision_wins'], totals['five_round_wins']).where(timed, 0).values,
+        'ground_finish_rate': _rate(totals['ground_ko_tko_wins'], totals['ko_tko_wins']).where(timed, 0).values,
+        'ground_landed_per_tko': _rate(totals['ground_landed_tko'], totals['ko_tko_wins'], 1).where(timed, 0).values,
+        'sig_str_landed_per_sec': _rate(totals['sig_str_landed'], total_time, 1).where(timed, 0).values,
+        'splm_std': accumulator.std(totals, 'splm').where(timed, 0).values
+    })
+    for column in ['finish_rate', 'ctrl_avg', 'leg_landed_avg', 'body_landed_avg', 'career_td_acc', 'ko_loss_rate',
+                   'five_round_win_rate', 'five_round_decision_rate', 'ground_finish_rate', 'ground_landed_per_tko', 'splm_std']:
+        derived[column] = _round(derived[column])
+    derived['sig_str_landed_per_sec'] = _round(derived['sig_str_landed_per_sec'], 4)
+    return derived
 
-        df = pd.DataFrame(derived_stats)
-        df.to_csv('data/derived_stats.csv', index=False)
+# Folds new fights into the saved per-fighter totals and rewrites only the affected fighters'
+# rows; full=True rebuilds everything, verify=True also compares against a full recompute and
+# returns the number of differing cells
+def calculate_derived_stats(full=False, verify=False):
+    try:
+        appearances = load_appearances(APPEARANCE_COLUMNS)
+        fighter_ids = appearances['own_id'].unique()
+        totals, affected, folded = accumulator.update(appearances, full=full)
+        df = None
+        if affected is not None and dataset_exists(OUTPUT_DATASET):
+            try:
+                df = merge_stats_dataset(OUTPUT_DATASET, stats_from_totals(totals.loc[totals.index.intersection(list(affected))]), fighter_ids)
+                logger.info(f"Updated derived stats for {len(affected)} fighters.")
+            except KeyError as e:
+                logger.warning(f"Recomputing every fighter's derived stats: {str(e)}")
+        if df is None:
+            # Fighter ids that never match a corner (missing ids) still get an all-zero row
+            df = stats_from_totals(totals.reindex(fighter_ids, fill_value=0))
+        save_dataset(OUTPUT_DATASET, df)
+        accumulator.save(totals, folded)
         logger.info(f"Generated derived_stats.csv for {len(fighter_ids)} fighters.")
         print(f"Generated derived_stats.csv for {len(fighter_ids)} fighters.")
+        if verify:
+            expected = stats_from_totals(accumulator.fold(appearances).reindex(fighter_ids, fill_value=0))
+            return compare_stats(expected, df, 'derived_stats.csv')
+        return 0
     except Exception as e:
         logger.error(f"Failed to calculate derived stats: {str(e)}")
         raise
 
-calculate_derived_stats()
\ No newline at end of file
+def main(argv=None):
+    logging.basicConfig(filename='derived_stats_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Calculate career derived stats per fighter from fight_details.csv')
+    parser.add_argument('--full', action='store_true', help='rebuild the per-fighter totals from every fight instead of folding in new ones')
+    parser.add_argument('--verify', action='store_true', help='compare the result against a full recompute and exit non-zero on any difference')
+    args = parser.parse_args(argv)
+    mismatches = calculate_derived_stats(full=args.full, verify=args.verify)
+    if mismatches:
+        print(f"derived_stats.csv differs from a full recompute in {mismatches} cells, see derived_stats_log.txt", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+import asyncio
+import functools
+import logging
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .http_cache import CachingSession, ResponseCache
+from .page_archive import PageArchive
+
+logger = logging.getLogger('fetch_engine')
+
+# Politeness budget per host and the number of requests allowed in flight at once
+REQUESTS_PER_SECOND = float(os.environ.get('SCRAPER_REQUESTS_PER_SECOND', '2'))
+MAX_CONCURRENCY = int(os.environ.get('SCRAPER_MAX_CONCURRENCY', '8'))
+INITIAL_CONCURRENCY = 2
+REQUEST_TIMEOUT = 15
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2
+BACKOFF_CAP = 60
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Transport errors that count against the server and are retried; a truncated or garbled body
+# is treated like a dropped connection
+RETRY_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError)
+PARSE_WORKERS = int(os.environ.get('SCRAPER_PARSE_WORKERS', os.cpu_count() or 1))
+PARSE_QUEUE_SIZE = int(os.environ.get('SCRAPER_PARSE_QUEUE_SIZE', '64'))
+
+# Pass use_cache=False for a plain session that always downloads full bodies
+def create_session(pool_size=MAX_CONCURRENCY, use_cache=True):
+    session = CachingSession(ResponseCache()) if use_cache else requests.Session()
+    # Retries and backoff are handled by the engine's AdaptiveController, not urllib3.
+    # Keep one keep-alive connection per in-flight request so pooled sockets are reused.
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# Token bucket that lets callers reserve a token ahead of time; the bucket may go into
+# debt and each caller sleeps until its reserved slot, so no lock is needed on the event loop
+class TokenBucket:
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+class HostRateLimiter:
+    def __init__(self, requests_per_second=REQUESTS_PER_SECOND, burst=1.0):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.buckets = {}
+
+    async def acquire(self, url):
+        host = urlsplit(url).netloc
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = TokenBucket(self.requests_per_second, self.burst)
+        await bucket.acquire()
+
+# Shared by every engine in the process so all scrapers draw from the same budget
+rate_limiter = HostRateLimiter()
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# AIMD concurrency limit: grows by roughly one slot per window of healthy responses, halves
+# on 429/5xx/connection errors and pauses everyone for Retry-After. After
+# failure_threshold consecutive failures the circuit opens and requests fail fast until
+# the cooldown passes, then a single probe decides whether to close it again.
+class AdaptiveController:
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=1, maximum=MAX_CONCURRENCY, decrease_factor=0.5,
+                 latency_tolerance=3.0, window=100, failure_threshold=8, cooldown=60):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.waiters = deque()
+        self.outcomes = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.resume_at = 0.0
+        self.open_until = None
+        self.probing = False
+        self.completed = 0
+
+    def _slots(self):
+        if self.open_until is not None:
+            return 0 if self.probing else 1
+        return max(self.minimum, int(self.limit))
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if self.open_until is not None and now < self.open_until:
+                raise CircuitOpenError(f"Circuit open for another {self.open_until - now:.0f}s after {self.consecutive_failures} consecutive failures")
+            if now < self.resume_at:
+                await asyncio.sleep(self.resume_at - now)
+                continue
+            if self.in_flight < self._slots():
+                self.in_flight += 1
+                if self.open_until is not None:
+                    self.probing = True
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+
+    # Returns the slot of a request that ended without saying anything about the server
+    # (cancelled, or an error of our own such as a bad URL); the limit and error rate stay as they are
+    def abandon(self):
+        self.in_flight -= 1
+        self.probing = False
+        self._wake()
+
+    def _wake(self):
+        free = self._slots() - self.in_flight
+        while self.waiters and free > 0:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def release(self, failed, latency, retry_after=None):
+        self.in_flight -= 1
+        self.completed += 1
+        self.outcomes.append(failed)
+        if failed:
+            self.consecutive_failures += 1
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            if retry_after:
+                self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
+            if self.probing or self.consecutive_failures >= self.failure_threshold:
+                # Re-opening after a failed probe doubles the cooldown
+                self.cooldown = self.cooldown * 2 if self.probing else self.base_cooldown
+                self.open_until = time.monotonic() + self.cooldown
+                logger.warning(f"Circuit opened for {self.cooldown}s: {self.stats()}")
+                # Queued requests fail fast instead of waiting out the cooldown
+                while self.waiters:
+                    waiter = self.waiters.popleft()
+                    if not waiter.done():
+                        waiter.set_result(None)
+            self.probing = False
+        else:
+            self.consecutive_failures = 0
+            if self.open_until is not None:
+                self.open_until = None
+                self.probing = False
+                self.cooldown = self.base_cooldown
+                logger.info("Circuit closed after a successful probe")
+            floor = min(self.latencies) if self.latencies else latency
+            self.latencies.append(latency)
+            if latency <= floor * self.latency_tolerance:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        if self.completed % 100 == 0:
+            logger.info(f"Fetch controller: {self.stats()}")
+        self._wake()
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            'concurrency': self._slots(),
+            'in_flight': self.in_flight,
+            'error_rate': round(sum(self.outcomes) / len(self.outcomes), 3) if self.outcomes else 0.0,
+            'median_latency': round(latencies[len(latencies) // 2], 3) if latencies else None,
+            'circuit_open': self.open_until is not None,
+            'completed': self.completed
+        }
+
+class FetchEngine:
+    def __init__(self, session=None, headers=None, max_concurrency=MAX_CONCURRENCY, limiter=None, timeout=REQUEST_TIMEOUT, archive=None):
+        self.session = session or create_session(max_concurrency)
+        self.archive = archive
+        self.headers = headers
+        self.max_concurrency = max_concurrency
+        self.limiter = limiter or rate_limiter
+        self.timeout = timeout
+        self.controller = AdaptiveController(maximum=max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='fetch')
+
+    async def fetch(self, url):
+        loop = asyncio.get_running_loop()
+        get = functools.partial(self.session.get, url, headers=self.headers, timeout=self.timeout)
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self.controller.acquire()
+            started = time.monotonic()
+            # Stays None when the request ends without a verdict on the server
+            failed = None
+            retry_after = None
+            response = None
+            try:
+                await self.limiter.acquire(url)
+                started = time.monotonic()
+                response = await loop.run_in_executor(self.executor, get)
+                failed = response.status_code in RETRY_STATUSES
+                if failed:
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            except RETRY_ERRORS as e:
+                failed = True
+                error = e
+            finally:
+                # Every acquired slot goes back, whatever ended the request
+                if failed is None:
+                    self.controller.abandon()
+                else:
+                    self.controller.release(failed, time.monotonic() - started, retry_after)
+            if not failed:
+                response.raise_for_status()
+                if self.archive is not None:
+                    self.archive.add(url, response.content)
+                return response
+            if response is not None:
+                error = requests.exceptions.HTTPError(f"{response.status_code} Server Error for url: {url}", response=response)
+            if attempt == MAX_ATTEMPTS:
+                raise error
+            # A Retry-After pause is enforced by the controller for every request
+            delay = 0 if retry_after is not None else min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            logger.warning(f"Attempt {attempt}/{MAX_ATTEMPTS} for {url} failed ({error}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def map(self, func, items):
+        return await asyncio.gather(*(func(item) for item in items))
+
+    def close(self):
+        logger.info(f"Fetch controller at shutdown: {self.controller.stats()}")
+        self.executor.shutdown(wait=False)
+        self.session.close()
+        if self.archive is not None:
+            self.archive.close()
+
+# Engine shared by the scrapers of one process. Created on first use, since building the
+# user agent, the HTTP cache index and the page archive all touch disk or network.
+_default_engine = None
+
+def get_default_engine():
+    global _default_engine
+    if _default_engine is None:
+        from fake_useragent import UserAgent
+        _default_engine = FetchEngine(headers={'User-Agent': UserAgent().chrome}, archive=PageArchive())
+    return _default_engine
+
+def close_default_engine():
+    global _default_engine
+    if _default_engine is not None:
+        _default_engine.close()
+        _default_engine = None
+
+# Second pipeline stage: fetchers push raw page bytes onto a bounded queue and a pool of
+# parser processes turns them into row dicts. A full queue makes fetchers wait (backpressure).
+class ParsePool:
+    def __init__(self, workers=PARSE_WORKERS, queue_size=PARSE_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = None
+        self.queue = None
+        self.consumers = []
+
+    async def __aenter__(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.consumers = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        for task in self.consumers:
+            task.cancel()
+        await asyncio.gather(*self.consumers, return_exceptions=True)
+        self.executor.shutdown()
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            future, parse_func, content, args = await self.queue.get()
+            try:
+                result = await loop.run_in_executor(self.executor, parse_func, content, *args)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+            finally:
+                self.queue.task_done()
+
+    async def parse(self, parse_func, content, *args):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((future, parse_func, content, args))
+        return await future
@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from .datastore import dataset_version, load_dataset
+
+logger = logging.getLogger('fighter_accumulators')
+
+ACCUMULATOR_DIR = os.path.join('.cache', 'accumulators')
+APPEARANCE_KEY = ['fight_id', 'corner']
+
+# Per-fighter running totals behind one stats stage, persisted between runs. Each stage turns
+# appearance rows into additive contributions; plain columns are summed and `welford` columns
+# keep count/mean/M2 so their population std can be updated without revisiting old fights.
+# Every folded appearance is remembered with a hash of its source columns: new appearances are
+# merged into the totals, while fighters with a changed or removed appearance are recomputed
+# from their current rows. The state is saved with the version of the output dataset written
+# from it; an output that changed since (a failed save, a rolled back commit) is rewritten in full.
+class FighterAccumulator:
+    def __init__(self, name, contributions, columns, welford=(), output=None):
+        self.name = name
+        self.contributions = contributions
+        self.columns = columns
+        self.welford = list(welford)
+        self.output = output
+        self.totals_path = os.path.join(ACCUMULATOR_DIR, f"{name}.parquet")
+        self.folded_path = os.path.join(ACCUMULATOR_DIR, f"{name}_folded.parquet")
+        self.version_path = os.path.join(ACCUMULATOR_DIR, f"{name}.json")
+
+    # Totals of every fighter in the given appearances, without touching the saved state
+    def fold(self, appearances):
+        values = self.contributions(appearances)
+        fighters = appearances['own_id']
+        totals = values.drop(columns=self.welford).groupby(fighters, sort=False).sum()
+        for column in self.welford:
+            grouped = values[column].groupby(fighters, sort=False)
+            mean = grouped.transform('mean')
+            totals[f"{column}_n"] = grouped.count()
+            totals[f"{column}_mean"] = grouped.mean()
+            totals[f"{column}_m2"] = ((values[column] - mean) ** 2).groupby(fighters, sort=False).sum()
+        return totals
+
+    # Chan et al. pairwise update for the welford columns, plain addition for the rest
+    def _merge(self, totals, batch):
+        index = totals.index.append(batch.index.difference(totals.index))
+        a = totals.reindex(index, fill_value=0)
+        b = batch.reindex(index, fill_value=0)
+        merged = a + b
+        for column in self.welford:
+            n_a, n_b = a[f"{column}_n"], b[f"{column}_n"]
+            n = (n_a + n_b).where(lambda count: count > 0)
+            delta = b[f"{column}_mean"] - a[f"{column}_mean"]
+            merged[f"{column}_n"] = n_a + n_b
+            merged[f"{column}_mean"] = (a[f"{column}_mean"] + delta * n_b / n).where(n_a > 0, b[f"{column}_mean"]).fillna(0)
+            merged[f"{column}_m2"] = (a[f"{column}_m2"] + b[f"{column}_m2"] + delta ** 2 * n_a * n_b / n).fillna(0)
+        return merged
+
+    def std(self, totals, column):
+        return np.sqrt(totals[f"{column}_m2"] / totals[f"{column}_n"].where(totals[f"{column}_n"] > 0)).fillna(0)
+
+    def _row_hashes(self, appearances):
+        return pd.util.hash_pandas_object(appearances[self.columns], index=False).values
+
+    def _load(self):
+        try:
+            return pd.read_parquet(self.totals_path), pd.read_parquet(self.folded_path)
+        except (FileNotFoundError, ImportError, OSError, ValueError) as e:
+            logger.info(f"No usable {self.name} accumulators, rebuilding from scratch: {str(e)}")
+            return None, None
+
+    def _output_version(self):
+        try:
+            return dataset_version(self.output) if self.output else None
+        except FileNotFoundError:
+            return None
+
+    def _saved_output_version(self):
+        try:
+            with open(self.version_path, encoding='utf-8') as f:
+                return json.load(f).get('output_version')
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # Persists the state returned by update(); call it only after the output dataset has been
+    # saved, so the recorded output version is the one written from these totals
+    def save(self, totals, folded):
+        os.makedirs(ACCUMULATOR_DIR, exist_ok=True)
+        try:
+            totals.to_parquet(self.totals_path + '.tmp')
+            folded.to_parquet(self.folded_path + '.tmp', index=False)
+        except ImportError as e:
+            logger.warning(f"Not saving {self.name} accumulators, no parquet engine available: {str(e)}")
+            return
+        with open(self.version_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'output': self.output, 'output_version': self._output_version()}, f)
+        os.replace(self.totals_path + '.tmp', self.totals_path)
+        os.replace(self.folded_path + '.tmp', self.folded_path)
+        os.replace(self.version_path + '.tmp', self.version_path)
+
+    # Brings the saved totals up to date with the appearances and returns them with the ids
+    # of the fighters whose totals changed (None when the output has to be rewritten in full)
+    # and the folded appearances to pass to save(); nothing is persisted here
+    def update(self, appearances, full=False):
+        current = appearances[APPEARANCE_KEY + ['own_id']].copy()
+        current['row_hash'] = self._row_hashes(appearances)
+        totals, folded = (None, None) if full else self._load()
+        if totals is None:
+            totals = self.fold(appearances)
+            logger.info(f"Rebuilt {self.name} accumulators for {len(totals)} fighters from {len(appearances)} appearances.")
+            return totals, None, current
+        # The totals still match the appearances, but rows written from them may not have stuck
+        output_version = self._output_version()
+        output_current = output_version is not None and output_version == self._saved_output_version()
+        if not output_current:
+            logger.info(f"{self.output} changed since the {self.name} accumulators were saved, rewriting every fighter.")
+
+        current_keys = pd.MultiIndex.from_frame(current[APPEARANCE_KEY])
+        folded_keys = pd.MultiIndex.from_frame(folded[APPEARANCE_KEY])
+        new = ~current_keys.isin(folded_keys)
+        removed = folded[~folded_keys.isin(current_keys)]
+        both = current[~new].merge(folded, on=APPEARANCE_KEY, suffixes=('', '_folded'))
+        changed = both[both['row_hash'] != both['row_hash_folded']]
+        # Changed and removed rows cannot be folded in; their fighters are recomputed from current rows
+        recomputed_ids = set(removed['own_id'].dropna()) | set(changed['own_id_folded'].dropna()) | set(changed['own_id'].dropna())
+        new_ids = set(current.loc[new, 'own_id'].dropna())
+        if not recomputed_ids and not new_ids and removed.empty:
+            logger.info(f"{self.name} accumulators up to date ({len(totals)} fighters).")
+            return totals, set() if output_current else None, current
+
+        owners = appearances['own_id']
+        fold_rows = new & ~owners.isin(recomputed_ids).values
+        totals = totals.drop(index=[fighter_id for fighter_id in recomputed_ids if fighter_id in totals.index])
+        if fold_rows.any():
+            totals = self._merge(totals, self.fold(appearances[fold_rows]))
+        recompute_rows = owners.isin(recomputed_ids)
+        if recompute_rows.any():
+            totals = self._merge(totals, self.fold(appearances[recompute_rows]))
+        logger.info(f"Folded {int(fold_rows.sum())} new appearances into {self.name} accumulators, "
+                    f"recomputed {len(recomputed_ids)} fighters with changed or removed appearances.")
+        return totals, new_ids | recomputed_ids if output_current else None, current
+
+# Rewrites only the rows of the affected fighters in an existing stats dataset; output rows
+# follow fighter_ids, the order a full recompute would write them in
+def merge_stats_dataset(name, updated, fighter_ids):
+    existing = load_dataset(name)
+    missing = set(fighter_ids) - set(existing['id']) - set(updated['id'])
+    if missing:
+        raise KeyError(f"{len(missing)} fighters missing from {name}")
+    df = pd.concat([existing[~existing['id'].isin(updated['id'])], updated], ignore_index=True)
+    return df.set_index('id').reindex(fighter_ids).reset_index()
+
+# Compares two versions of a stats table cell by cell; returns the number of differing cells
+def compare_stats(expected, actual, label):
+    expected = expected.set_index('id')
+    actual = actual.set_index('id').reindex(index=expected.index, columns=expected.columns)
+    differs = ~np.isclose(expected.to_numpy(dtype=float, na_value=np.nan), actual.to_numpy(dtype=float, na_value=np.nan),
+                          rtol=0, atol=1e-9, equal_nan=True)
+    mismatches = int(differs.sum())
+    if mismatches:
+        rows, cols = np.nonzero(differs)
+        examples = ", ".join(f"{expected.index[row]}.{expected.columns[col]}: {expected.iat[row, col]} != {actual.iat[row, col]}"
+                             for row, col in list(zip(rows, cols))[:10])
+        logger.error(f"{label}: {mismatches} cells differ from a full recompute. {examples}")
+    else:
+        logger.info(f"{label}: matches a full recompute for {len(expected)} fighters.")
+    return mismatches
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger('http_cache')
+
+CACHE_DIR = os.path.join('.cache', 'http')
+MAX_CACHE_BYTES = int(os.environ.get('SCRAPER_HTTP_CACHE_MB', '512')) * 1024 * 1024
+INDEX_FLUSH_EVERY = 100
+
+# On-disk store of response bodies plus their validators, evicted least-recently-used
+class ResponseCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        self.pending_writes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+        self.total_bytes = sum(entry['size'] for entry in self.entries.values())
+
+    def _body_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def validators(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return {}
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+
+    def load(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None, None
+            try:
+                with open(self._body_path(url), 'rb') as f:
+                    body = f.read()
+            except FileNotFoundError:
+                self._remove(url)
+                return None, None
+            entry['last_access'] = time.time()
+            return body, entry.get('encoding')
+
+    # Returns True when the body is byte-for-byte what was cached last time
+    def store(self, url, response):
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        with self.lock:
+            previous = self.entries.get(url)
+            unchanged = previous is not None and previous['sha256'] == digest
+            if not unchanged:
+                with open(self._body_path(url), 'wb') as f:
+                    f.write(body)
+            if previous is not None:
+                self.total_bytes -= previous['size']
+            self.entries[url] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'sha256': digest,
+                'encoding': response.encoding,
+                'size': len(body),
+                'last_access': time.time()
+            }
+            self.total_bytes += len(body)
+            self._evict()
+            self.pending_writes += 1
+            if self.pending_writes >= INDEX_FLUSH_EVERY:
+                self._flush()
+        return unchanged
+
+    def _remove(self, url):
+        entry = self.entries.pop(url)
+        self.total_bytes -= entry['size']
+        try:
+            os.remove(self._body_path(url))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for url in sorted(self.entries, key=lambda u: self.entries[u]['last_access']):
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._remove(url)
+            logger.info(f"Evicted {url} from HTTP cache")
+
+    def _flush(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.index_path)
+        self.pending_writes = 0
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+# Session that sends conditional GETs and marks responses whose content has not changed.
+# A 304 is turned back into a 200 carrying the cached body so callers see a normal response.
+class CachingSession(requests.Session):
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def request(self, method, url, headers=None, **kwargs):
+        if method.upper() != 'GET':
+            return super().request(method, url, headers=headers, **kwargs)
+        conditional_headers = dict(headers or {})
+        conditional_headers.update(self.cache.validators(url))
+        response = super().request(method, url, headers=conditional_headers, **kwargs)
+        response.unchanged = False
+        if response.status_code == 304:
+            body, encoding = self.cache.load(url)
+            if body is None:
+                # Body went missing from disk, fall back to a plain request
+                response = super().request(method, url, headers=headers, **kwargs)
+                response.unchanged = False
+            else:
+                response.status_code = 200
+                response._content = body
+                response.encoding = encoding
+                response.unchanged = True
+                logger.info(f"Not modified: {url}")
+        if response.status_code == 200 and not response.unchanged:
+            response.unchanged = self.cache.store(url, response)
+        return response
+
+    def close(self):
+        self.cache.flush()
+        super().close()
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+logger = logging.getLogger('page_archive')
+
+ARCHIVE_DIR = os.path.join('.cache', 'archive')
+ARCHIVED_KINDS = {'fight-details': 'fight', 'event-details': 'event', 'fighter-details': 'fighter'}
+
+def page_kind(url):
+    for path, kind in ARCHIVED_KINDS.items():
+        if f"/{path}/" in url:
+            return kind
+    return None
+
+# Append-only store of compressed page bodies. pages.dat holds the zlib records back to back
+# and index.jsonl maps each URL to the offset of its latest record.
+class PageArchive:
+    def __init__(self, archive_dir=ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        self.data_path = os.path.join(archive_dir, 'pages.dat')
+        self.index_path = os.path.join(archive_dir, 'index.jsonl')
+        self.lock = threading.Lock()
+        self.index = {}
+        os.makedirs(archive_dir, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from an interrupted run
+                        continue
+                    self.index[entry['url']] = entry
+        self.data_file = None
+        self.index_file = None
+
+    def add(self, url, body):
+        kind = page_kind(url)
+        if kind is None:
+            return
+        digest = hashlib.sha256(body).hexdigest()
+        with self.lock:
+            previous = self.index.get(url)
+            if previous is not None and previous['sha256'] == digest:
+                return
+            if self.data_file is None:
+                self.data_file = open(self.data_path, 'ab')
+                self.index_file = open(self.index_path, 'a', encoding='utf-8')
+            record = zlib.compress(body, 6)
+            offset = self.data_file.seek(0, os.SEEK_END)
+            self.data_file.write(record)
+            self.data_file.flush()
+            entry = {'url': url, 'kind': kind, 'offset': offset, 'length': len(record), 'sha256': digest, 'fetched_at': time.time()}
+            self.index_file.write(json.dumps(entry) + '\n')
+            self.index_file.flush()
+            self.index[url] = entry
+
+    def entries(self, kind=None):
+        return [entry for entry in self.index.values() if kind is None or entry['kind'] == kind]
+
+    def close(self):
+        with self.lock:
+            if self.data_file is not None:
+                self.data_file.close()
+                self.index_file.close()
+                self.data_file = self.index_file = None
+
+def read_record(data_file, entry):
+    data_file.seek(entry['offset'])
+    return zlib.decompress(data_file.read(entry['length']))
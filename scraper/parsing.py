@@ -0,0 +1,337 @@
+from collections import namedtuple
+from datetime import datetime
+
+from lxml import etree, html as lxml_html
+
+EVENT_DATE_FORMAT = "%B %d, %Y"
+# What the parsers raise on a malformed or truncated page
+PARSE_ERRORS = (ValueError, IndexError, KeyError)
+
+# Pre-compiled XPath expressions, shared by every page parsed in the process
+def _has_class(tag, class_name):
+    return f"{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+LISTING_ROWS = etree.XPath('//' + _has_class('tr', 'b-statistics__table-row'))
+LISTING_LINK = etree.XPath('.//' + _has_class('a', 'b-link_style_black') + '/@href')
+LISTING_DATE = etree.XPath('string(.//' + _has_class('span', 'b-statistics__date') + ')')
+FIGHTER_LINKS = etree.XPath('//' + _has_class('a', 'b-link_style_black') + "/@href[contains(., '/fighter-details/')]")
+
+EVENT_TITLE = etree.XPath('string(//' + _has_class('span', 'b-content__title-highlight') + ')')
+EVENT_INFO_ITEMS = etree.XPath('//' + _has_class('li', 'b-list__box-list-item'))
+EVENT_FIGHT_ROWS = etree.XPath('//' + _has_class('tr', 'js-fight-details-click'))
+ROW_RESULT_FLAG = etree.XPath('string(.//' + _has_class('i', 'b-flag__text') + ')')
+ROW_CELLS = etree.XPath('./td')
+CELL_LINES = etree.XPath('./p')
+CELL_BELT = etree.XPath(".//img[contains(@src, 'belt')]")
+ROW_FIGHTER_LINKS = etree.XPath('.//' + _has_class('td', 'l-page_align_left') + '//' + _has_class('a', 'b-link_style_black'))
+
+FIGHT_EVENT_LINK = etree.XPath('(//' + _has_class('a', 'b-link') + ')[1]')
+FIGHT_PERSON_LINKS = etree.XPath('//' + _has_class('a', 'b-fight-details__person-link'))
+FIGHT_TITLE = etree.XPath('string(//' + _has_class('i', 'b-fight-details__fight-title') + ')')
+FIGHT_METHOD = etree.XPath("string(//i[@style='font-style: normal'])")
+FIGHT_TEXT_ITEMS = etree.XPath('(//' + _has_class('p', 'b-fight-details__text') + ')[1]/' + _has_class('i', 'b-fight-details__text-item'))
+FIGHT_STAT_TEXTS = etree.XPath('//' + _has_class('p', 'b-fight-details__table-text'))
+
+FIGHTER_NAME = etree.XPath('string(//' + _has_class('span', 'b-content__title-highlight') + ')')
+FIGHTER_NICKNAME = etree.XPath('string(//' + _has_class('p', 'b-content__Nickname') + ')')
+FIGHTER_RECORD = etree.XPath('string(//' + _has_class('span', 'b-content__title-record') + ')')
+FIGHTER_DETAIL_ITEMS = etree.XPath('//' + _has_class('li', 'b-list__box-list-item_type_block'))
+
+# Field specs: (column, node index, kind). Fight stats are listed for the red corner;
+# the blue corner value always sits in the next node.
+Field = namedtuple('Field', ['column', 'index', 'kind'])
+
+FIGHT_STAT_FIELDS = [
+    Field('kd', 2, 'count'),
+    Field('sig_str', 4, 'x_of_y'),
+    Field('sig_str_acc', 6, 'pct'),
+    Field('total_str', 8, 'x_of_y'),
+    Field('total_str_acc', 10, 'pct'),
+    Field('td', 12, 'x_of_y'),
+    Field('td_acc', 14, 'pct'),
+    Field('sub_att', 16, 'count'),
+    Field('ctrl', 20, 'mm:ss'),
+    Field('head', 22, 'x_of_y'),
+    Field('head_acc', 24, 'pct'),
+    Field('body', 26, 'x_of_y'),
+    Field('body_acc', 28, 'pct'),
+    Field('leg', 30, 'x_of_y'),
+    Field('leg_acc', 32, 'pct'),
+    Field('dist', 34, 'x_of_y'),
+    Field('dist_acc', 36, 'pct'),
+    Field('clinch', 38, 'x_of_y'),
+    Field('clinch_acc', 40, 'pct'),
+    Field('ground', 42, 'x_of_y'),
+    Field('ground_acc', 44, 'pct'),
+    Field('landed_head_per', 46, 'pct'),
+    Field('landed_body_per', 48, 'pct'),
+    Field('landed_leg_per', 50, 'pct'),
+    Field('landed_dist_per', 52, 'pct'),
+    Field('landed_clinch_per', 54, 'pct'),
+    Field('landed_ground_per', 56, 'pct')
+]
+
+# Bout table on completed event pages: (column, cell index, kind), red corner on the
+# first line of the cell and blue corner on the second
+EVENT_ROW_STAT_FIELDS = [
+    Field('kd', 2, 'count'),
+    Field('sig_str_landed', 3, 'count'),
+    Field('td_landed', 4, 'count'),
+    Field('sub_att', 5, 'count')
+]
+EVENT_ROW_DIVISION = 6
+EVENT_ROW_METHOD = 7
+EVENT_ROW_ROUND = 8
+EVENT_ROW_TIME = 9
+
+# Event pages abbreviate the method; map it to the wording used on fight pages
+EVENT_ROW_METHODS = {
+    'KO/TKO': 'KO/TKO',
+    'SUB': 'Submission',
+    'U-DEC': 'Decision - Unanimous',
+    'S-DEC': 'Decision - Split',
+    'M-DEC': 'Decision - Majority',
+    'CNC': 'Could Not Continue',
+    'DQ': 'DQ',
+    'Overturned': 'Overturned',
+    'Other': 'Other'
+}
+
+FIGHTER_DETAIL_FIELDS = [
+    Field('height', 0, 'height'),
+    Field('weight', 1, 'weight'),
+    Field('reach', 2, 'reach'),
+    Field('stance', 3, 'text'),
+    Field('dob', 4, 'text'),
+    Field('splm', 5, 'float'),
+    Field('str_acc', 6, 'int_pct'),
+    Field('sapm', 7, 'float'),
+    Field('str_def', 8, 'int_pct'),
+    Field('td_avg', 10, 'float'),
+    Field('td_acc', 11, 'int_pct'),
+    Field('td_def', 12, 'int_pct'),
+    Field('sub_avg', 13, 'float')
+]
+
+# Record columns of the statistics/fighters listing table
+FIGHTER_LISTING_FIELDS = [
+    Field('wins', 7, 'int'),
+    Field('losses', 8, 'int'),
+    Field('draws', 9, 'int')
+]
+
+# Profile fields that are often blank on ufcstats and fall back to None
+OPTIONAL_FIGHTER_FIELDS = {'height', 'weight', 'reach', 'stance', 'dob'}
+
+def _to_seconds(text):
+    if ":" not in text:
+        return 0
+    minutes, seconds = text.split(":")
+    return int(minutes) * 60 + int(seconds)
+
+def _to_pct(text):
+    text = text.replace("%", "").strip()
+    return None if text.startswith("--") else float(text)
+
+def _to_height(text):
+    feet_inches = text.replace("'", "").replace('"', '').split()
+    return round((int(feet_inches[0]) * 12 + int(feet_inches[1])) * 2.54, 2)
+
+def _to_text(text):
+    return None if text in ("", "--") else text
+
+CONVERTERS = {
+    'count': float,
+    'pct': _to_pct,
+    'mm:ss': _to_seconds,
+    'float': float,
+    'int': int,
+    'int_pct': lambda text: int(text.replace("%", "")),
+    'height': _to_height,
+    'weight': lambda text: round(float(text.replace(" lbs", "")) * 0.45359237, 2),
+    'reach': lambda text: round(int(text.replace('"', "")) * 2.54, 2),
+    'text': _to_text
+}
+
+def _parse_html(html):
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='replace')
+    return lxml_html.fromstring(html)
+
+def _text(node):
+    return node.text_content().strip()
+
+# Strip the "Label:" prefix from a labelled list item
+def _item_value(node):
+    text = _text(node)
+    return text.split(":", 1)[1].strip() if ":" in text else text
+
+def _link_id(href):
+    return href.strip()[-16:]
+
+def parse_event_date(text):
+    try:
+        return datetime.strptime(text.strip(), EVENT_DATE_FORMAT).date()
+    except (AttributeError, ValueError):
+        return None
+
+# Event listings (completed and upcoming) as (link, date) pairs in page order
+def parse_event_listing(html):
+    tree = _parse_html(html)
+    listing = []
+    for row in LISTING_ROWS(tree):
+        links = LISTING_LINK(row)
+        if not links:
+            continue
+        event_date = LISTING_DATE(row)
+        listing.append((links[0], parse_event_date(event_date) if event_date.strip() else None))
+    return listing
+
+def parse_fighter_links(html):
+    return [str(link) for link in FIGHTER_LINKS(_parse_html(html))]
+
+# Fighter listing as one {id, wins, losses, draws} dict per row
+def parse_fighter_listing(html):
+    tree = _parse_html(html)
+    listing = []
+    for row in LISTING_ROWS(tree):
+        links = LISTING_LINK(row)
+        if not links or '/fighter-details/' not in links[0]:
+            continue
+        cells = ROW_CELLS(row)
+        data_dic = {"id": _link_id(links[0])}
+        try:
+            for field in FIGHTER_LISTING_FIELDS:
+                data_dic[field.column] = CONVERTERS[field.kind](_text(cells[field.index]))
+        except (IndexError, ValueError):
+            for field in FIGHTER_LISTING_FIELDS:
+                data_dic[field.column] = None
+        listing.append(data_dic)
+    return listing
+
+# Result columns of a completed bout row; empty for upcoming cards
+def _parse_row_summary(row):
+    try:
+        cells = [[_text(line) for line in CELL_LINES(cell)] for cell in ROW_CELLS(row)]
+        method = cells[EVENT_ROW_METHOD][0]
+        summary = {
+            "division": cells[EVENT_ROW_DIVISION][0].lower(),
+            "title_fight": 1 if CELL_BELT(ROW_CELLS(row)[EVENT_ROW_DIVISION]) else 0,
+            "method": EVENT_ROW_METHODS.get(method, method),
+            "finish_round": int(cells[EVENT_ROW_ROUND][0]),
+            "match_time_sec": _to_seconds(cells[EVENT_ROW_TIME][0])
+        }
+        for corner, line in (('r', 0), ('b', 1)):
+            for field in EVENT_ROW_STAT_FIELDS:
+                summary[f"{corner}_{field.column}"] = CONVERTERS[field.kind](cells[field.index][line])
+        return summary
+    except (IndexError, ValueError):
+        return {}
+
+# Event page: header info plus one entry per bout row
+def parse_event_page(html):
+    tree = _parse_html(html)
+    info_items = EVENT_INFO_ITEMS(tree)
+    fights = []
+    for row in EVENT_FIGHT_ROWS(tree):
+        fighter_links = ROW_FIGHTER_LINKS(row)
+        fights.append({
+            "fight_link": row.get('data-link'),
+            "result": ROW_RESULT_FLAG(row).strip(),
+            "r_name": _text(fighter_links[0]) if fighter_links else None,
+            "r_id": _link_id(fighter_links[0].get('href')) if fighter_links else None,
+            "b_name": _text(fighter_links[1]) if len(fighter_links) > 1 else None,
+            "b_id": _link_id(fighter_links[1].get('href')) if len(fighter_links) > 1 else None,
+            "summary": _parse_row_summary(row)
+        })
+    return {
+        "event_name": EVENT_TITLE(tree).strip(),
+        "date": _item_value(info_items[0]),
+        "location": _item_value(info_items[1]),
+        "fights": fights
+    }
+
+# event_details.csv row for a decided bout; the winner is always listed first
+def event_result_row(event, event_id, fight):
+    return {
+        "event_id": event_id,
+        "fight_id": fight['fight_link'][-16:],
+        "date": event['date'],
+        "location": event['location'],
+        "winner": fight['r_name'],
+        "winner_id": fight['r_id']
+    }
+
+# Matchup header shared by completed and upcoming fight pages
+def _parse_bout_header(tree, link):
+    event_link = FIGHT_EVENT_LINK(tree)[0]
+    fighter_links = FIGHT_PERSON_LINKS(tree)
+    division_info = FIGHT_TITLE(tree).lower()
+    is_title_fight = 1 if 'title' in division_info else 0
+    division_info = division_info.replace('ufc', "").replace("title", "").replace("bout", "").strip()
+    return {
+        "event_name": _text(event_link),
+        "event_id": _link_id(event_link.get('href')),
+        "fight_id": link[-16:],
+        "r_name": _text(fighter_links[0]),
+        "r_id": _link_id(fighter_links[0].get('href')),
+        "b_name": _text(fighter_links[1]),
+        "b_id": _link_id(fighter_links[1].get('href')),
+        "division": division_info,
+        "title_fight": is_title_fight
+    }
+
+def parse_upcoming_fight_page(html, link):
+    return _parse_bout_header(_parse_html(html), link)
+
+def _parse_fight_stats(stat_texts, corner, offset):
+    stats = {}
+    for field in FIGHT_STAT_FIELDS:
+        text = stat_texts[field.index + offset]
+        if field.kind == 'x_of_y':
+            landed, attempted = text.split(" of ")
+            stats[f"{corner}_{field.column}_landed"] = float(landed)
+            stats[f"{corner}_{field.column}_atmpted"] = float(attempted)
+        else:
+            stats[f"{corner}_{field.column}"] = CONVERTERS[field.kind](text)
+    return stats
+
+def parse_fight_page(html, link):
+    tree = _parse_html(html)
+    data_dic = _parse_bout_header(tree, link)
+    text_nodes = FIGHT_TEXT_ITEMS(tree)
+    text_items = [node.text_content().lower() for node in text_nodes]
+    total_rounds = text_items[2].replace("time format:", "").strip()
+    data_dic.update({
+        "method": FIGHT_METHOD(tree).strip(),
+        "finish_round": int(text_items[0].replace("round:", "").strip()),
+        "match_time_sec": _to_seconds(text_items[1].replace("time:", "").strip()),
+        "total_rounds": None if total_rounds == "no time limit" else int(total_rounds[0]),
+        "referee": _text(text_nodes[3]).replace("Referee:", "").strip()
+    })
+    # One pass over the stat nodes, then every field is looked up by index
+    stat_texts = [_text(node) for node in FIGHT_STAT_TEXTS(tree)]
+    data_dic.update(_parse_fight_stats(stat_texts, 'r', 0))
+    data_dic.update(_parse_fight_stats(stat_texts, 'b', 1))
+    return data_dic
+
+def parse_fighter_page(html, fighter_id):
+    tree = _parse_html(html)
+    fighter_record = FIGHTER_RECORD(tree).replace("Record:", "").strip().split('-')
+    data_dic = {
+        "id": fighter_id,
+        "name": FIGHTER_NAME(tree).strip(),
+        "nick_name": FIGHTER_NICKNAME(tree).strip(),
+        "wins": int(fighter_record[0].split()[0]),
+        "losses": int(fighter_record[1].split()[0]),
+        "draws": int(fighter_record[2].split()[0])
+    }
+    detail_items = FIGHTER_DETAIL_ITEMS(tree)
+    for field in FIGHTER_DETAIL_FIELDS:
+        try:
+            data_dic[field.column] = CONVERTERS[field.kind](_item_value(detail_items[field.index]))
+        except (IndexError, ValueError):
+            if field.column not in OPTIONAL_FIGHTER_FIELDS:
+                raise
+            data_dic[field.column] = None
+    return data_dic
@@ -0,0 +1,70 @@
+import json
+import logging
+import os
+
+import pandas as pd
+
+logger = logging.getLogger('record_sink')
+
+SPOOL_DIR = os.path.join('.cache', 'spool')
+SPOOL_BATCH_SIZE = int(os.environ.get('SCRAPER_SPOOL_BATCH_SIZE', '500'))
+
+# Collects scraped rows for one dataset. Keys are deduplicated with a set, rows are held
+# in a small buffer and written to an NDJSON spool file in batches, and the whole spool is
+# read back once by to_frame() when the CSV is written.
+# With replace=True a later row for the same key wins instead of being dropped.
+class RecordSink:
+    def __init__(self, name, key_fields, replace=False, spool_dir=SPOOL_DIR, batch_size=SPOOL_BATCH_SIZE):
+        self.name = name
+        self.key_fields = key_fields
+        self.replace = replace
+        self.batch_size = batch_size
+        self.path = os.path.join(spool_dir, f'{name}.ndjson')
+        self.keys = set()
+        self.buffer = []
+        self.count = 0
+        os.makedirs(spool_dir, exist_ok=True)
+        # Each run starts with an empty spool; rows from an interrupted run come back through the journal
+        self.file = open(self.path, 'w', encoding='utf-8')
+
+    def key(self, row):
+        return tuple(str(row[field]) for field in self.key_fields)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, row):
+        key = self.key(row)
+        if key in self.keys and not self.replace:
+            return False
+        self.keys.add(key)
+        self.buffer.append(row)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        if not self.buffer:
+            return
+        self.file.write(''.join(json.dumps(row, default=str) + '\n' for row in self.buffer))
+        self.file.flush()
+        self.count += len(self.buffer)
+        self.buffer = []
+
+    def to_frame(self):
+        self.flush()
+        if not self.count:
+            return pd.DataFrame()
+        # dtype=False keeps hex ids such as 1234e567... from being read as numbers
+        df = pd.read_json(self.path, lines=True, dtype=False, convert_dates=False)
+        if self.replace:
+            df = df.drop_duplicates(subset=self.key_fields, keep='last')
+        logger.info(f"Merged {len(df)} {self.name} rows from {self.path}")
+        return df
+
+    def close(self):
+        self.file.close()
+        os.remove(self.path)
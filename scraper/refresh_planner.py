@@ -0,0 +1,76 @@
+import logging
+import os
+import time
+import zlib
+
+import pandas as pd
+
+logger = logging.getLogger('refresh_planner')
+
+REFRESH_STATE_FILE = 'data/fighter_refresh.csv'
+FIGHTER_TTL_DAYS = float(os.environ.get('SCRAPER_FIGHTER_TTL_DAYS', '90'))
+RECORD_COLUMNS = ['wins', 'losses', 'draws']
+
+# id -> unix time of the last successful fetch of the fighter page
+def load_refresh_state(file_path=REFRESH_STATE_FILE):
+    try:
+        df = pd.read_csv(file_path, dtype={'id': str})
+        return dict(zip(df['id'], df['scraped_at']))
+    except (FileNotFoundError, KeyError):
+        return {}
+
+def save_refresh_state(state, file_path=REFRESH_STATE_FILE):
+    pd.DataFrame({'id': list(state), 'scraped_at': list(state.values())}).to_csv(file_path, index=False)
+
+# Fighters already in fighter_details.csv but never tracked get a pseudo-random age inside
+# the TTL, so the first refresh cycle is spread over many runs instead of landing on one
+def _seed_scraped_at(fighter_id, now, ttl_seconds):
+    return now - zlib.crc32(fighter_id.encode('utf-8')) % max(1, int(ttl_seconds))
+
+# W/L/D as ints, or None when any part is missing or unreadable; a stored record written as
+# floats or strings still compares equal to the listing's ints
+def _record(wins, losses, draws):
+    try:
+        record = tuple(int(float(value)) for value in (wins, losses, draws) if not pd.isna(value))
+    except (TypeError, ValueError):
+        return None
+    return record if len(record) == 3 else None
+
+# Fighter ids worth fetching: new on the listing, W/L/D changed since fighter_details.csv
+# was written, booked on an upcoming card, or not fetched for longer than the TTL. A record
+# unknown on either side is left to the TTL
+def plan_fighter_refresh(listing, existing_fighters, upcoming_ids, state, ttl_days=FIGHTER_TTL_DAYS, now=None):
+    now = now or time.time()
+    ttl_seconds = ttl_days * 86400
+    known_records = {}
+    if not existing_fighters.empty and set(RECORD_COLUMNS).issubset(existing_fighters.columns):
+        for fighter_id, wins, losses, draws in zip(existing_fighters['id'].astype(str), *(existing_fighters[column] for column in RECORD_COLUMNS)):
+            known_records[fighter_id] = _record(wins, losses, draws)
+
+    reasons = {'new': [], 'record': [], 'upcoming': [], 'stale': []}
+    planned = set()
+    for row in listing:
+        fighter_id = row['id']
+        if fighter_id not in known_records:
+            reasons['new'].append(fighter_id)
+        elif known_records[fighter_id] is not None and _record(row['wins'], row['losses'], row['draws']) not in (None, known_records[fighter_id]):
+            reasons['record'].append(fighter_id)
+        else:
+            continue
+        planned.add(fighter_id)
+    for fighter_id in upcoming_ids:
+        if fighter_id not in planned:
+            reasons['upcoming'].append(fighter_id)
+            planned.add(fighter_id)
+    for fighter_id in known_records:
+        if fighter_id in planned:
+            continue
+        scraped_at = state.get(fighter_id)
+        if scraped_at is None:
+            scraped_at = state[fighter_id] = _seed_scraped_at(fighter_id, now, ttl_seconds)
+        if now - scraped_at > ttl_seconds:
+            reasons['stale'].append(fighter_id)
+            planned.add(fighter_id)
+
+    logger.info("Fighter refresh plan: " + ", ".join(f"{len(ids)} {reason}" for reason, ids in reasons.items()))
+    return [fighter_id for ids in reasons.values() for fighter_id in ids]
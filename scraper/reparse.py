@@ -0,0 +1,106 @@
+import pandas as pd
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from .datastore import DATASETS, apply_schema, dataset_exists, load_dataset, save_dataset
+from .page_archive import PageArchive, read_record
+from .parsing import event_result_row, parse_event_date, parse_event_page, parse_fight_page, parse_fighter_page
+
+logger = logging.getLogger('reparse')
+
+archive_file = None
+
+def open_archive(data_path):
+    global archive_file
+    archive_file = open(data_path, 'rb')
+
+# Runs in a worker process; pages that do not parse (e.g. bouts that had not happened yet
+# when they were archived) come back with the error instead of a row
+def parse_archived_page(entry):
+    url = entry['url']
+    try:
+        html = read_record(archive_file, entry)
+        if entry['kind'] == 'event':
+            return entry, parse_event_page(html), None
+        if entry['kind'] == 'fight':
+            return entry, parse_fight_page(html, url), None
+        return entry, parse_fighter_page(html, url[-16:]), None
+    except Exception as e:
+        return entry, None, str(e)
+
+# Saves the reparsed rows through the datastore, merged into the existing dataset by key
+# unless replace is set
+def write_rows(name, rows, key, replace):
+    df = apply_schema(pd.DataFrame(data=rows), DATASETS[name])
+    if not replace and dataset_exists(name):
+        df = pd.concat([load_dataset(name), df], ignore_index=True).drop_duplicates(subset=key, keep='last')
+    df = save_dataset(name, df)
+    logger.info(f"Wrote {len(df)} rows to the {name} dataset")
+
+# Dates of fights whose event page is not in the archive, from the fight and event datasets
+def stored_fight_dates(df_fight):
+    dates = pd.Series(pd.NaT, index=df_fight.index, dtype='datetime64[ns]')
+    if dataset_exists('fight_details'):
+        stored = load_dataset('fight_details', ['fight_id', 'date']).dropna().drop_duplicates('fight_id', keep='last')
+        dates = dates.fillna(df_fight['fight_id'].map(stored.set_index('fight_id')['date']))
+    if dataset_exists('event_details'):
+        stored = load_dataset('event_details', ['event_id', 'date']).dropna().drop_duplicates('event_id', keep='last')
+        dates = dates.fillna(df_fight['event_id'].map(stored.set_index('event_id')['date']))
+    return dates
+
+def reparse(replace=False):
+    archive = PageArchive()
+    entries = archive.entries()
+    workers = os.cpu_count() or 1
+    logger.info(f"Reparsing {len(entries)} archived pages with {workers} workers")
+    event_rows = []
+    fight_rows = []
+    fighter_rows = []
+    event_dates = {}
+    failed = 0
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=open_archive, initargs=(archive.data_path,)) as executor:
+        for entry, result, error in executor.map(parse_archived_page, entries, chunksize=64):
+            if error is not None:
+                failed += 1
+                logger.warning(f"Skipped {entry['url']}: {error}")
+                continue
+            if entry['kind'] == 'event':
+                event_id = entry['url'][-16:]
+                event_dates[event_id] = parse_event_date(result['date'])
+                event_rows.extend(event_result_row(result, event_id, fight) for fight in result['fights'] if fight['result'] == "win")
+            elif entry['kind'] == 'fight':
+                fight_rows.append(result)
+            else:
+                fighter_rows.append(result)
+
+    if event_rows:
+        write_rows('event_details', event_rows, ['event_id', 'fight_id'], replace)
+    if fight_rows:
+        for data_dic in fight_rows:
+            data_dic["date"] = event_dates.get(data_dic["event_id"])
+        df_fight = pd.DataFrame(data=fight_rows)
+        df_fight['date'] = pd.to_datetime(df_fight['date']).astype('datetime64[ns]')
+        if not replace:
+            # A merged row must not lose the date it already has
+            undated = df_fight['date'].isna()
+            if undated.any():
+                df_fight.loc[undated, 'date'] = stored_fight_dates(df_fight[undated])
+                logger.info(f"Took the dates of {int(undated.sum())} fights without an archived event page from the stored datasets")
+        write_rows('fight_details', df_fight, ['fight_id'], replace)
+    if fighter_rows:
+        write_rows('fighter_details', fighter_rows, ['id'], replace)
+
+    logger.info(f"Reparse complete. {len(event_rows)} event rows, {len(fight_rows)} fights, {len(fighter_rows)} fighters, {failed} pages skipped.")
+    print(f"Reparse complete. {len(event_rows)} event rows, {len(fight_rows)} fights, {len(fighter_rows)} fighters, {failed} pages skipped.")
+
+def main(argv=None):
+    logging.basicConfig(filename='reparse_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Rebuild the scraped CSVs from the local page archive without any network access')
+    parser.add_argument('--replace', action='store_true', help='overwrite the CSVs instead of merging the reparsed rows into them')
+    args = parser.parse_args(argv)
+    reparse(replace=args.replace)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+from datetime import date, datetime, timedelta, timezone
+from .datastore import load_dataset
+
+logger = logging.getLogger('scheduler')
+
+STATE_FILE = os.path.join('.cache', 'scheduler_state.json')
+
+# Cards finish around 05:00 UTC the day after their listed date; results are ingested a
+# few hours later and retried every RESULTS_RETRY_HOURS until they show up or we give up
+RESULTS_DELAY_HOURS = 34
+RESULTS_RETRY_HOURS = 6
+RESULTS_GIVE_UP_DAYS = 3
+# The upcoming card is refreshed daily in fight week and weekly otherwise
+FIGHT_WEEK_DAYS = 7
+UPCOMING_FIGHT_WEEK_HOURS = 24
+UPCOMING_QUIET_HOURS = 24 * 7
+
+STAGES = ['results', 'upcoming']
+
+# Pipeline commands (python -m scraper <command>) in workflow order with the stages that need them
+PIPELINE = [
+    ('core', {'results'}),
+    ('defensive', {'results'}),
+    ('derived', {'results'}),
+    ('combine', {'results'}),
+    ('badges', {'results'}),
+    ('comprehensive', {'results'}),
+    ('upcoming', {'upcoming'}),
+    ('upload', {'results', 'upcoming'})
+]
+# A stage counts as done once the command that ingests its data succeeds; until then the
+# next run plans it again
+STAGE_COMMANDS = {'results': 'core', 'upcoming': 'upcoming'}
+
+# Stage timestamps plus the events whose results are still owed, by event id with the event date
+def load_state():
+    try:
+        with open(STATE_FILE, encoding='utf-8') as f:
+            saved = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    try:
+        state = {stage: datetime.fromisoformat(saved[stage]) for stage in STAGES if stage in saved}
+        state['owed_results'] = {event_id: date.fromisoformat(value) for event_id, value in saved.get('owed_results', {}).items()}
+    except (AttributeError, TypeError, ValueError):
+        logger.error(f"{STATE_FILE} is malformed, starting from an empty state.")
+        return {}
+    return state
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    saved = {stage: state[stage].isoformat() for stage in STAGES if stage in state}
+    saved['owed_results'] = {event_id: value.isoformat() for event_id, value in state.get('owed_results', {}).items()}
+    with open(STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(saved, f, indent=1)
+
+def load_event_calendar():
+    try:
+        upcoming = load_dataset('upcoming_event_details', ['event_id', 'date']).dropna(subset=['date'])
+        upcoming_events = [(event_id, event_date.date()) for event_id, event_date in zip(upcoming['event_id'], upcoming['date'])]
+    except (FileNotFoundError, KeyError):
+        logger.error("data/upcoming_event_details.csv not found or missing required columns.")
+        upcoming_events = []
+    try:
+        completed_event_ids = set(load_dataset('event_details', ['event_id'])['event_id'])
+    except (FileNotFoundError, KeyError):
+        logger.error("data/event_details.csv not found or missing required columns.")
+        completed_event_ids = set()
+    return upcoming_events, completed_event_ids
+
+def _start_of(event_date):
+    return datetime(event_date.year, event_date.month, event_date.day, tzinfo=timezone.utc)
+
+def _results_at(event_date):
+    return _start_of(event_date) + timedelta(hours=RESULTS_DELAY_HOURS)
+
+# Events on or before today without results in event_details yet. A card drops off the upcoming
+# listing as soon as it is over, often before its results are due, so each one is remembered
+# from the first run that sees it on its date until its results are ingested or we give up
+def owed_results(now, upcoming_events, completed_event_ids, owed):
+    owed = dict(owed)
+    for event_id, event_date in upcoming_events:
+        if event_date <= now.date():
+            owed.setdefault(event_id, event_date)
+    kept = {}
+    for event_id, event_date in owed.items():
+        if event_id in completed_event_ids:
+            continue
+        if now >= _results_at(event_date) + timedelta(days=RESULTS_GIVE_UP_DAYS):
+            logger.warning(f"Giving up on results for event {event_id} on {event_date}")
+            continue
+        kept[event_id] = event_date
+    return kept
+
+# Stages that are due now, each with the reason it was picked
+def plan(now, upcoming_events, owed, state):
+    due = {}
+    last_results = state.get('results')
+    for event_id, event_date in sorted(owed.items(), key=lambda item: item[1]):
+        results_at = _results_at(event_date)
+        if now < results_at:
+            continue
+        if last_results is None or last_results < results_at or now - last_results >= timedelta(hours=RESULTS_RETRY_HOURS):
+            due['results'] = f"event {event_id} on {event_date} has no results yet"
+            break
+
+    if 'results' in due:
+        # A finished card drops off the upcoming listing
+        due['upcoming'] = "refresh after results ingest"
+    else:
+        next_dates = [event_date for _, event_date in upcoming_events if _start_of(event_date) + timedelta(days=1) > now]
+        fight_week = bool(next_dates) and _start_of(min(next_dates)) - now <= timedelta(days=FIGHT_WEEK_DAYS)
+        interval = timedelta(hours=UPCOMING_FIGHT_WEEK_HOURS if fight_week else UPCOMING_QUIET_HOURS)
+        last_upcoming = state.get('upcoming')
+        if last_upcoming is None or now - last_upcoming >= interval:
+            due['upcoming'] = "fight week refresh" if fight_week else "weekly refresh"
+    return due
+
+# Runs the due stages' commands and returns the stages whose first command succeeded
+def run_stages(stages):
+    done = set()
+    for command, needed_by in PIPELINE:
+        if not needed_by & stages:
+            continue
+        logger.info(f"Running {command}")
+        if subprocess.run([sys.executable, '-m', 'scraper', command]).returncode != 0:
+            # Same policy as the workflow: later steps still run on partial data
+            logger.error(f"{command} failed, continuing...")
+        else:
+            done.update(stage for stage in stages if STAGE_COMMANDS[stage] == command)
+    return done
+
+def main(argv=None):
+    logging.basicConfig(filename='scheduler_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Work out which pipeline stages are due from the event calendar')
+    parser.add_argument('--run', action='store_true', help='run the due stages instead of only reporting them')
+    parser.add_argument('--force', action='store_true', help='treat every stage as due')
+    parser.add_argument('--mark-done', choices=STAGES, action='append', default=[], help='record that a stage ran successfully and exit')
+    parser.add_argument('--github-output', default=os.environ.get('GITHUB_OUTPUT'), help='file to append <stage>=true|false lines to')
+    args = parser.parse_args(argv)
+
+    now = datetime.now(timezone.utc)
+    state = load_state()
+    if args.mark_done:
+        # The workflow runs this after a stage's ingest step succeeds
+        for stage in args.mark_done:
+            state[stage] = now
+            logger.info(f"{stage}: done")
+        save_state(state)
+        return
+
+    upcoming_events, completed_event_ids = load_event_calendar()
+    state['owed_results'] = owed_results(now, upcoming_events, completed_event_ids, state.get('owed_results', {}))
+    if args.force:
+        due = {stage: "forced" for stage in STAGES}
+    else:
+        due = plan(now, upcoming_events, state['owed_results'], state)
+    for stage in STAGES:
+        message = f"{stage}: {'due (' + due[stage] + ')' if stage in due else 'not due'}"
+        logger.info(message)
+        print(message)
+
+    if args.github_output:
+        with open(args.github_output, 'a', encoding='utf-8') as f:
+            for stage in STAGES:
+                f.write(f"{stage}={'true' if stage in due else 'false'}\n")
+
+    # Without --run the workflow runs the due stages in the steps that follow and marks
+    # each one done after its ingest step succeeds
+    if args.run and due:
+        for stage in run_stages(set(due)):
+            state[stage] = now
+    save_state(state)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger('scrape_journal')
+
+JOURNAL_DIR = os.path.join('.cache', 'journal')
+MAX_DEAD_LETTER_ATTEMPTS = int(os.environ.get('SCRAPER_MAX_DEAD_LETTER_ATTEMPTS', '5'))
+
+# Write-ahead log of finished pages and the rows parsed from them. Each completed URL is
+# appended as one JSON line as soon as it is parsed, so a rerun after a crash replays the
+# rows instead of fetching the pages again. Cleared once the CSVs have been written.
+# Only the URLs are kept in memory; replay() streams the rows back from disk.
+class ScrapeJournal:
+    def __init__(self, name, journal_dir=JOURNAL_DIR):
+        self.path = os.path.join(journal_dir, f'{name}.jsonl')
+        self.records = {}
+        self.file = None
+        os.makedirs(journal_dir, exist_ok=True)
+        for record in self._read():
+            self.records[record['url']] = record['kind']
+        if self.records:
+            logger.info(f"Resuming from {self.path} with {len(self.records)} completed pages")
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A torn last line from an interrupted run
+                    continue
+
+    def done(self, url):
+        return url in self.records
+
+    def replay(self, kind):
+        for record in self._read():
+            if record['kind'] == kind:
+                yield record['data']
+
+    def complete(self, kind, url, data=None):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        record = {'kind': kind, 'url': url, 'data': data}
+        self.file.write(json.dumps(record, default=str) + '\n')
+        self.file.flush()
+        self.records[url] = kind
+
+    def clear(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.records = {}
+
+# URLs that failed in earlier runs, kept with their attempt count so later runs retry them
+# directly instead of having to find them again in the listings
+class DeadLetterQueue:
+    def __init__(self, name, journal_dir=JOURNAL_DIR, max_attempts=MAX_DEAD_LETTER_ATTEMPTS):
+        self.path = os.path.join(journal_dir, f'{name}_dead_letters.json')
+        self.max_attempts = max_attempts
+        os.makedirs(journal_dir, exist_ok=True)
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def add(self, kind, url, error):
+        entry = self.entries.setdefault(url, {'kind': kind, 'attempts': 0})
+        entry['attempts'] += 1
+        entry['error'] = str(error)
+        entry['failed_at'] = time.time()
+        self.save()
+
+    def resolve(self, url):
+        if self.entries.pop(url, None) is not None:
+            logger.info(f"Recovered dead letter {url}")
+            self.save()
+
+    # URLs of the given kind still worth retrying; ones past max_attempts stay in the file for inspection
+    def due(self, kind):
+        urls = []
+        for url, entry in self.entries.items():
+            if entry['kind'] != kind:
+                continue
+            if entry['attempts'] >= self.max_attempts:
+                logger.warning(f"Giving up on {url} after {entry['attempts']} attempts: {entry['error']}")
+                continue
+            urls.append(url)
+        return urls
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp_path, self.path)
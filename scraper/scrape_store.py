@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import sqlite3
+from collections import namedtuple
+from datetime import date, datetime
+
+import pandas as pd
+
+from .datastore import DATASETS, dataset_version, load_dataset, save_dataset
+from .parsing import EVENT_DATE_FORMAT
+
+logger = logging.getLogger('scrape_store')
+
+STORE_FILE = os.path.join('.cache', 'scrape_store.sqlite3')
+UPSERT_BATCH_SIZE = int(os.environ.get('SCRAPER_UPSERT_BATCH_SIZE', '1000'))
+
+# One table per scraped dataset: the key is the primary key, indexed columns and the ISO
+# `date` (parsed with date_format) are copied out of the row for lookups, and the row itself
+# is kept as JSON so summary rows and full fight rows can share a table
+Table = namedtuple('Table', ['name', 'dataset', 'key', 'indexed', 'date_format'])
+
+TABLES = {table.name: table for table in [
+    Table('events', 'event_details', ['event_id', 'fight_id'], [], EVENT_DATE_FORMAT),
+    Table('fights', 'fight_details', ['fight_id'], ['event_id', 'r_id', 'b_id'], '%Y/%m/%d'),
+    Table('fighters', 'fighter_details', ['id'], [], None)
+]}
+
+def _json_default(value):
+    # numpy scalars from typed frames
+    return value.item() if hasattr(value, 'item') else str(value)
+
+def _iso_date(value, date_format):
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    try:
+        return datetime.strptime(str(value), date_format).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+# Plain Python rows for JSON, with missing values as None and dates in the dataset's CSV format
+def frame_to_rows(df, date_format=None):
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime(date_format)
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+# Scrape state of the core scraper in an embedded SQLite database (WAL mode). Existence checks
+# are primary-key lookups and saving upserts only the new rows, so neither costs time in
+# proportion to the history. The datasets in data/ stay the source of truth: a table whose
+# dataset changed outside the store (reparse, a manual edit) is reloaded from it on open.
+class ScrapeStore:
+    def __init__(self, path=STORE_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS sources (dataset TEXT PRIMARY KEY, version TEXT)')
+            for table in TABLES.values():
+                self._create(table)
+        for table in TABLES.values():
+            self._sync(table)
+
+    def _create(self, table):
+        columns = list(dict.fromkeys(table.key + table.indexed))
+        if table.date_format:
+            columns.append('date')
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table.name} ({', '.join(f'{column} TEXT' for column in columns)}, "
+                          f"data TEXT NOT NULL, PRIMARY KEY ({', '.join(table.key)}))")
+        for column in table.indexed + (['date'] if table.date_format else []):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table.name}_{column} ON {table.name} ({column})")
+
+    def _version(self, table):
+        try:
+            return json.dumps(dataset_version(table.dataset))
+        except FileNotFoundError:
+            return None
+
+    def _recorded_version(self, table):
+        row = self.conn.execute('SELECT version FROM sources WHERE dataset = ?', (table.dataset,)).fetchone()
+        return row[0] if row else None
+
+    def _record_version(self, table):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO sources (dataset, version) VALUES (?, ?)', (table.dataset, self._version(table)))
+
+    def _sync(self, table):
+        version = self._version(table)
+        if version is None or version == self._recorded_version(table):
+            return
+        df = load_dataset(table.dataset)
+        with self.conn:
+            self.conn.execute(f"DELETE FROM {table.name}")
+        self.upsert(table.name, frame_to_rows(df, DATASETS[table.dataset].date_format))
+        self._record_version(table)
+        logger.info(f"Loaded {len(df)} {table.name} rows from the {table.dataset} dataset.")
+
+    # Inserts or replaces rows by key in batched transactions; a replaced row moves to the end,
+    # as the rewritten CSV used to order it
+    def upsert(self, name, rows):
+        table = TABLES[name]
+        columns = list(dict.fromkeys(table.key + table.indexed))
+        sql_columns = columns + (['date'] if table.date_format else []) + ['data']
+        sql = f"INSERT OR REPLACE INTO {name} ({', '.join(sql_columns)}) VALUES ({', '.join('?' for _ in sql_columns)})"
+        count = 0
+        batch = []
+        for row in rows:
+            values = [None if row.get(column) is None else str(row[column]) for column in columns]
+            if table.date_format:
+                values.append(_iso_date(row.get('date'), table.date_format))
+            values.append(json.dumps(row, default=_json_default))
+            batch.append(values)
+            if len(batch) >= UPSERT_BATCH_SIZE:
+                with self.conn:
+                    self.conn.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            with self.conn:
+                self.conn.executemany(sql, batch)
+            count += len(batch)
+        return count
+
+    def _exists(self, name, column, value):
+        return self.conn.execute(f"SELECT 1 FROM {name} WHERE {column} = ? LIMIT 1", (str(value),)).fetchone() is not None
+
+    def has_event(self, event_id):
+        return self._exists('events', 'event_id', event_id)
+
+    def has_fight(self, fight_id):
+        return self._exists('fights', 'fight_id', fight_id)
+
+    def has_fighter(self, fighter_id):
+        return self._exists('fighters', 'id', fighter_id)
+
+    def count(self, name):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+
+    def last_date(self, name):
+        value = self.conn.execute(f"SELECT MAX(date) FROM {name}").fetchone()[0]
+        return date.fromisoformat(value) if value else None
+
+    def event_date(self, event_id):
+        value = self.conn.execute('SELECT date FROM events WHERE event_id = ? LIMIT 1', (str(event_id),)).fetchone()
+        return date.fromisoformat(value[0]) if value and value[0] else None
+
+    # Rows of a table in insertion order; fields= extracts only those row fields
+    def frame(self, name, fields=None):
+        if fields is None:
+            rows = [json.loads(data) for (data,) in self.conn.execute(f"SELECT data FROM {name} ORDER BY rowid")]
+            return pd.DataFrame(rows)
+        selects = ', '.join(f"json_extract(data, '$.{field}')" for field in fields)
+        return pd.DataFrame(self.conn.execute(f"SELECT {selects} FROM {name} ORDER BY rowid").fetchall(), columns=fields)
+
+    # Saves a table to its dataset (store and CSV snapshot) and remembers the new version
+    def export(self, name):
+        table = TABLES[name]
+        df = save_dataset(table.dataset, self.frame(name))
+        self._record_version(table)
+        logger.info(f"Saved {len(df)} {name} rows to the {table.dataset} dataset.")
+        return df
+
+    def close(self):
+        self.conn.close()
@@ -1,193 +1,214 @@
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-from fake_useragent import UserAgent
-from urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
-import threading
-from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import hashlib
+import json
 import logging
-import time
+import os
+from .datastore import dataset_exists, load_dataset, save_dataset
+from .fetch_engine import ParsePool, close_default_engine, get_default_engine
+from .record_sink import RecordSink
+from .parsing import PARSE_ERRORS, parse_event_listing, parse_event_page, parse_upcoming_fight_page
 
-# Setup logging
-logging.basicConfig(filename='upcoming_scraper_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('upcoming_scraper')
 
-lock = threading.Lock()
-upcoming_event_details = []
-upcoming_fight_details = []
+FINGERPRINT_FILE = os.path.join('.cache', 'upcoming_fingerprints.json')
+
+# Per-run state, set up by init_run() so importing this module is free of side effects
+engine = None
+parse_pool = None
+upcoming_event_details = None
+upcoming_fight_details = None
+existing_upcoming_events = pd.DataFrame()
+existing_upcoming_fights = pd.DataFrame()
+fingerprints = {}
+upcoming_event_links = []
 new_upcoming_fight_links = []
-MAX_THREADS = 2
-ua = UserAgent()
-HEADER = {'User-Agent': ua.chrome}
-
-def create_session():
-    session = requests.Session()
-    retry_strat = Retry(backoff_factor=15, total=10, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
-    adapter = HTTPAdapter(max_retries=retry_strat)
-    session.mount('https://', adapter)
-    session.mount('http://', adapter)
-    return session
-
-session = create_session()
-
-def get_existing_ids(file_path, id_field, date_field=None):
+fight_event_ids = {}
+removed_fight_ids = set()
+removed_event_ids = set()
+# Saved card of every known event: event_id -> {fight_id: (r_id, b_id)}
+existing_bouts = {}
+# Fingerprints are only committed once every changed bout of the event has been fetched
+pending_fingerprints = {}
+
+def read_existing(name):
+    return load_dataset(name) if dataset_exists(name) else pd.DataFrame()
+
+def load_fingerprints():
     try:
-        df = pd.read_csv(file_path)
-        ids = set(df[id_field].astype(str).unique())
-        max_date = df[date_field].max() if date_field and date_field in df.columns else '1900-01-01'
-        return ids, max_date
-    except (FileNotFoundError, KeyError):
-        logger.error(f"{file_path} not found or missing required columns.")
-        return set(), '1900-01-01'
-
-# Load existing CSVs
-existing_upcoming_event_ids, last_upcoming_event_date = get_existing_ids('data/upcoming_event_details.csv', 'event_id', 'date')
-existing_upcoming_fight_ids = get_existing_ids('data/upcoming_fight_details.csv', 'fight_id')[0]
-logger.info(f"Last upcoming event date: {last_upcoming_event_date}. Found {len(existing_upcoming_event_ids)} upcoming events, {len(existing_upcoming_fight_ids)} upcoming fights.")
-
-# Load existing CSVs
-try:
-    existing_upcoming_events = pd.read_csv('data/upcoming_event_details.csv')
-    existing_upcoming_fights = pd.read_csv('data/upcoming_fight_details.csv')
-except FileNotFoundError:
-    existing_upcoming_events = pd.DataFrame()
-    existing_upcoming_fights = pd.DataFrame()
-
-# Scrape upcoming event links
-def scrape_event_links():
+        with open(FINGERPRINT_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_fingerprints(fingerprints):
+    os.makedirs(os.path.dirname(FINGERPRINT_FILE), exist_ok=True)
+    with open(FINGERPRINT_FILE, 'w', encoding='utf-8') as f:
+        json.dump(fingerprints, f, indent=1)
+
+def init_run():
+    global engine, parse_pool, upcoming_event_details, upcoming_fight_details
+    global existing_upcoming_events, existing_upcoming_fights, fingerprints
+    engine = get_default_engine()
+    parse_pool = ParsePool()
+    upcoming_event_details = RecordSink('upcoming_event_details', ['event_id'], replace=True)
+    upcoming_fight_details = RecordSink('upcoming_fight_details', ['fight_id'], replace=True)
+    for state in (upcoming_event_links, new_upcoming_fight_links, fight_event_ids, removed_fight_ids, removed_event_ids, existing_bouts, pending_fingerprints):
+        state.clear()
+
+    # Load existing datasets
+    existing_upcoming_events = read_existing('upcoming_event_details')
+    existing_upcoming_fights = read_existing('upcoming_fight_details')
+    if not existing_upcoming_fights.empty:
+        for event_id, fight_id, r_id, b_id in zip(existing_upcoming_fights['event_id'], existing_upcoming_fights['fight_id'], existing_upcoming_fights['r_id'], existing_upcoming_fights['b_id']):
+            existing_bouts.setdefault(event_id, {})[fight_id] = (r_id, b_id)
+    logger.info(f"Found {len(existing_upcoming_events)} upcoming events, {len(existing_upcoming_fights)} upcoming fights.")
+    fingerprints = load_fingerprints()
+
+# Hash of the ordered bout list; any booking, cancellation, swap or reorder changes it
+def bout_fingerprint(event):
+    bouts = '|'.join(f"{fight['fight_link'][-16:]}:{fight['r_id']}:{fight['b_id']}" for fight in event['fights'])
+    return hashlib.sha1(bouts.encode('utf-8')).hexdigest()
+
+# Leaves an event's card uncommitted so the next run fetches and diffs it again; the page body
+# is already in the HTTP cache, so a kept fingerprint would let it through as not modified
+def forget_card(event_id):
+    pending_fingerprints.pop(event_id, None)
+    fingerprints.pop(event_id, None)
+
+# Scrape upcoming event links with the dates shown on the listing
+async def scrape_event_listing():
     try:
-        response = session.get("http://ufcstats.com/statistics/events/upcoming")
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
-        event_links_soup = soup.find_all('a', class_='b-link b-link_style_black')
-        return [link['href'] for link in event_links_soup]
+        response = await engine.fetch("http://ufcstats.com/statistics/events/upcoming")
+        return await parse_pool.parse(parse_event_listing, response.content)
     except Exception as e:
         logger.error(f"Failed to scrape upcoming event links: {str(e)}")
         return []
 
-upcoming_event_links = scrape_event_links()
-logger.info(f"Found {len(upcoming_event_links)} upcoming events.")
-
-# Filter new upcoming events
-new_upcoming_event_links = []
-for link in upcoming_event_links:
-    try:
-        event_id = link[-16:]
-        if event_id in existing_upcoming_event_ids:
-            continue
-        event_response = session.get(link)
-        event_response.raise_for_status()
-        event_soup = BeautifulSoup(event_response.text, 'lxml')
-        date_loc_list = event_soup.find_all('li', 'b-list__box-list-item')
-        date = date_loc_list[0].text.replace("Date:", "").strip()
-        if date > last_upcoming_event_date:
-            new_upcoming_event_links.append(link)
-        time.sleep(2)
-    except Exception as e:
-        logger.error(f"Failed to check upcoming event {link}: {str(e)}")
-        continue
-
-logger.info(f"Found {len(new_upcoming_event_links)} new upcoming events.")
-
-def get_upcoming_event_data(item):
+async def get_upcoming_event_data(item):
     idx, link = item
     try:
-        response = session.get(link, headers=HEADER, timeout=15)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
         event_id = link[-16:]
-        if event_id in existing_upcoming_event_ids:
+        response = await engine.fetch(link)
+        if response.unchanged and event_id in fingerprints:
+            logger.info(f"Upcoming event {idx+1}/{len(upcoming_event_links)} not modified: {link}")
+            return
+        event = await parse_pool.parse(parse_event_page, response.content)
+        data_dic = {
+            "event_id": event_id,
+            "event_name": event['event_name'],
+            "date": event['date'],
+            "location": event['location']
+        }
+        upcoming_event_details.add(data_dic)
+        fingerprint = bout_fingerprint(event)
+        if fingerprints.get(event_id) == fingerprint:
+            logger.info(f"Upcoming event {idx+1}/{len(upcoming_event_links)} card unchanged: {link}")
             return
-        event_name = soup.find('span', class_='b-content__title-highlight').text.strip()
-        date_loc_list = soup.find_all('li', 'b-list__box-list-item')
-        date = date_loc_list[0].text.replace("Date:", "").strip()
-        location = date_loc_list[1].text.replace("Location:", "").strip()
-        fight_links = soup.find_all('tr', class_='b-fight-details__table-row b-fight-details__table-row__hover js-fight-details-click')
-        with lock:
-            data_dic = {
-                "event_id": event_id,
-                "event_name": event_name,
-                "date": date,
-                "location": location
-            }
-            upcoming_event_details.append(data_dic)
-            for i in fight_links:
-                fight_id = i['data-link'][-16:]
-                if fight_id in existing_upcoming_fight_ids:
-                    continue
-                new_upcoming_fight_links.append(i['data-link'])
-            logger.info(f"Scraped upcoming event {idx+1}/{len(new_upcoming_event_links)}: {link}")
-        time.sleep(2)
+
+        # Card changed: fetch only added bouts and bouts with a different matchup, drop the rest
+        known_bouts = existing_bouts.get(event_id, {})
+        card = set()
+        for fight in event['fights']:
+            fight_id = fight['fight_link'][-16:]
+            card.add(fight_id)
+            if known_bouts.get(fight_id) != (fight['r_id'], fight['b_id']):
+                new_upcoming_fight_links.append(fight['fight_link'])
+                fight_event_ids[fight['fight_link']] = event_id
+        removed = set(known_bouts) - card
+        removed_fight_ids.update(removed)
+        pending_fingerprints[event_id] = fingerprint
+        logger.info(f"Scraped upcoming event {idx+1}/{len(upcoming_event_links)}: {link} ({len(card)} bouts, {len(removed)} removed)")
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to retrieve upcoming event {link}: {str(e)}")
+    except PARSE_ERRORS as e:
+        logger.error(f"Failed to parse upcoming event {link}: {type(e).__name__}: {str(e)}")
+        forget_card(link[-16:])
 
-def get_upcoming_fight_data(item):
+async def get_upcoming_fight_data(item):
     idx, link = item
     try:
-        response = session.get(link, headers=HEADER, timeout=15)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
-        event_name = soup.find('a', class_="b-link").text.strip()
-        event_id = soup.find('a', class_="b-link")['href'][-16:]
-        fight_id = link[-16:]
-        if fight_id in existing_upcoming_fight_ids:
-            return
-        fighter_nams = soup.find_all('a', class_='b-fight-details__person-link')
-        r_name = fighter_nams[0].text.strip()
-        b_name = fighter_nams[1].text.strip()
-        r_id = fighter_nams[0]['href'].strip()[-16:]
-        b_id = fighter_nams[1]['href'].strip()[-16:]
-        division_info = soup.find('i', class_='b-fight-details__fight-title').text.lower()
-        is_title_fight = 0
-        if 'title' in division_info:
-            is_title_fight = 1
-        division_info = division_info.replace('ufc', "").replace("title", "").replace("bout", "").strip()
-        with lock:
-            data_dic = {
-                "event_name": event_name,
-                "event_id": event_id,
-                "fight_id": fight_id,
-                "r_name": r_name,
-                "r_id": r_id,
-                "b_name": b_name,
-                "b_id": b_id,
-                "division": division_info,
-                "title_fight": is_title_fight
-            }
-            upcoming_fight_details.append(data_dic)
-            logger.info(f"Scraped upcoming fight {idx+1}/{len(new_upcoming_fight_links)}: {link}")
-        time.sleep(2)
+        response = await engine.fetch(link)
+        upcoming_fight_details.add(await parse_pool.parse(parse_upcoming_fight_page, response.content, link))
+        logger.info(f"Scraped upcoming fight {idx+1}/{len(new_upcoming_fight_links)}: {link}")
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed upcoming fight {idx+1}/{len(new_upcoming_fight_links)}: {link} - {str(e)}")
-
-# Run upcoming event and fight scraping
-with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-    results = [executor.submit(get_upcoming_event_data, item) for item in enumerate(new_upcoming_event_links)]
-    for r in results:
-        r.result()
-
-with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-    results = [executor.submit(get_upcoming_fight_data, item) for item in enumerate(new_upcoming_fight_links)]
-    for r in results:
-        r.result()
-
-# Append new data to CSVs
-if upcoming_event_details:
-    df_upcoming_event = pd.DataFrame(data=upcoming_event_details)
-    if not existing_upcoming_events.empty:
-        df_upcoming_event = pd.concat([existing_upcoming_events, df_upcoming_event]).drop_duplicates(subset=['event_id'], keep='last')
-    df_upcoming_event.to_csv("data/upcoming_event_details.csv", index=False)
-else:
-    logger.info("No new upcoming events to save.")
-
-if upcoming_fight_details:
-    df_upcoming_fight = pd.DataFrame(data=upcoming_fight_details)
-    if not existing_upcoming_fights.empty:
-        df_upcoming_fight = pd.concat([existing_upcoming_fights, df_upcoming_fight]).drop_duplicates(subset=['fight_id'], keep='last')
-    df_upcoming_fight.to_csv("data/upcoming_fight_details.csv", index=False)
-else:
-    logger.info("No new upcoming fights to save.")
-
-logger.info(f"Upcoming scraper complete. Updated {len(upcoming_event_details)} upcoming events, {len(upcoming_fight_details)} upcoming fights.")
-print(f"Upcoming scraper complete. Updated {len(upcoming_event_details)} upcoming events, {len(upcoming_fight_details)} upcoming fights.")
\ No newline at end of file
+        # Diff this event again next run
+        forget_card(fight_event_ids[link])
+    except PARSE_ERRORS as e:
+        logger.error(f"Failed to parse upcoming fight {idx+1}/{len(new_upcoming_fight_links)}: {link} - {type(e).__name__}: {str(e)}")
+        forget_card(fight_event_ids[link])
+
+async def scrape():
+    async with parse_pool:
+        upcoming_event_listing = await scrape_event_listing()
+        logger.info(f"Found {len(upcoming_event_listing)} upcoming events.")
+        upcoming_event_links.extend(link for link, _ in upcoming_event_listing)
+        if upcoming_event_links:
+            # Events that left the listing were held or cancelled
+            listed_ids = {link[-16:] for link in upcoming_event_links}
+            known_ids = set(existing_bouts) | (set(existing_upcoming_events['event_id']) if not existing_upcoming_events.empty else set())
+            removed_event_ids.update(known_ids - listed_ids)
+            logger.info(f"Removing {len(removed_event_ids)} events no longer on the upcoming listing.")
+
+        # Run upcoming event and fight scraping
+        await engine.map(get_upcoming_event_data, enumerate(upcoming_event_links))
+        # A bout moved to another card is refetched there, not deleted
+        removed_fight_ids.difference_update(link[-16:] for link in new_upcoming_fight_links)
+        logger.info(f"{len(pending_fingerprints)} upcoming cards changed, {len(new_upcoming_fight_links)} bouts to fetch, {len(removed_fight_ids)} bouts removed.")
+        await engine.map(get_upcoming_fight_data, enumerate(new_upcoming_fight_links))
+
+# Merge updated rows into the datasets and drop removed events and bouts
+def save_results():
+    if upcoming_event_details or removed_event_ids:
+        df_upcoming_event = upcoming_event_details.to_frame()
+        if not existing_upcoming_events.empty:
+            df_upcoming_event = pd.concat([existing_upcoming_events, df_upcoming_event]).drop_duplicates(subset=['event_id'], keep='last')
+        df_upcoming_event = df_upcoming_event[~df_upcoming_event['event_id'].isin(removed_event_ids)]
+        save_dataset('upcoming_event_details', df_upcoming_event)
+    else:
+        logger.info("No upcoming event changes to save.")
+
+    if upcoming_fight_details or removed_fight_ids or removed_event_ids:
+        df_upcoming_fight = upcoming_fight_details.to_frame()
+        if not existing_upcoming_fights.empty:
+            df_upcoming_fight = pd.concat([existing_upcoming_fights, df_upcoming_fight]).drop_duplicates(subset=['fight_id'], keep='last')
+        df_upcoming_fight = df_upcoming_fight[~df_upcoming_fight['fight_id'].isin(removed_fight_ids) & ~df_upcoming_fight['event_id'].isin(removed_event_ids)]
+        save_dataset('upcoming_fight_details', df_upcoming_fight)
+    else:
+        logger.info("No upcoming fight changes to save.")
+
+    fingerprints.update(pending_fingerprints)
+    for event_id in removed_event_ids:
+        fingerprints.pop(event_id, None)
+    save_fingerprints(fingerprints)
+
+# Entry point for the CLI and in-process runners; returns a summary of what changed
+def run():
+    init_run()
+    try:
+        asyncio.run(scrape())
+    finally:
+        close_default_engine()
+    save_results()
+    upcoming_event_details.close()
+    upcoming_fight_details.close()
+    return {
+        'events': len(upcoming_event_details),
+        'fights': len(upcoming_fight_details),
+        'removed_events': len(removed_event_ids),
+        'removed_fights': len(removed_fight_ids)
+    }
+
+def main(argv=None):
+    logging.basicConfig(filename='upcoming_scraper_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    argparse.ArgumentParser(description='Keep the upcoming UFC cards in sync with ufcstats.com').parse_args(argv)
+    summary = run()
+    message = f"Upcoming scraper complete. Updated {summary['events']} upcoming events, {summary['fights']} upcoming fights, removed {summary['removed_events']} events and {summary['removed_fights']} fights."
+    logger.info(message)
+    print(message)
+
+if __name__ == '__main__':
+    main()
@@ -1,114 +1,193 @@
 import pandas as pd
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core import exceptions
 import os
 import numpy as np
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .datastore import csv_path, export_datasets
 
-# Setup logging
-logging.basicConfig(filename='firestore_upload_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('upload_to_firestore')
 
-def upload_to_firestore():
+# Path to your service account key JSON file, relative to the repository root by default
+FIREBASE_CREDENTIALS = os.environ.get('FIREBASE_CREDENTIALS', os.path.join('config', 'firebase-adminsdk.json'))
+
+def get_firestore_client(cred_path=FIREBASE_CREDENTIALS):
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app(credentials.Certificate(cred_path))
+    return firestore.client()
+
+# One document per event: fight ids and winners as lists
+def aggregate_events(df, collection_name, id_field='event_id'):
+    agg_columns = {
+        'date': 'first',
+        'location': 'first'
+    }
+    if collection_name == 'events':
+        agg_columns.update({
+            'fight_id': lambda x: list(x),
+            'winner': lambda x: list(x),
+            'winner_id': lambda x: list(x)
+        })
+    elif collection_name == 'upcoming_events':
+        agg_columns['event_name'] = 'first'
+    return df.groupby(id_field).agg(agg_columns).reset_index()
+
+def to_document(doc_data):
+    # Handle badges for fighters
+    if 'badges' in doc_data and isinstance(doc_data['badges'], str) and doc_data['badges']:
+        doc_data['badges'] = doc_data['badges'].split(',')
+    else:
+        doc_data['badges'] = []
+    # Convert NaN values to None
+    for key, value in doc_data.items():
+        if isinstance(value, float) and np.isnan(value):
+            doc_data[key] = None
+    return doc_data
+
+# Firestore rejects commits of more than 500 writes
+BATCH_SIZE = 500
+READ_CHUNK_SIZE = 500
+MAX_BATCH_ATTEMPTS = int(os.environ.get('SCRAPER_FIRESTORE_ATTEMPTS', '5'))
+RETRY_BACKOFF = 2.0
+# Transient errors a batch is retried on; anything else fails the batch at once
+RETRYABLE_ERRORS = (exceptions.Aborted, exceptions.DeadlineExceeded, exceptions.InternalServerError,
+                    exceptions.ResourceExhausted, exceptions.ServiceUnavailable)
+
+# Datasets to upload and their collection names
+UPLOADS = [
+    {'dataset': 'comprehensive_fighter_details', 'collection': 'fighters', 'id_field': 'id'},
+    {'dataset': 'event_details', 'collection': 'events', 'id_field': 'event_id'},
+    {'dataset': 'fight_details', 'collection': 'fights', 'id_field': 'fight_id'},
+    {'dataset': 'upcoming_event_details', 'collection': 'upcoming_events', 'id_field': 'event_id'},
+    {'dataset': 'upcoming_fight_details', 'collection': 'upcoming_fights', 'id_field': 'fight_id'}
+]
+
+# Stored documents in the shape to_document builds, so unchanged rows compare equal
+def normalize_existing(existing_data, collection_name):
+    # Convert badges to list for comparison
+    if 'badges' in existing_data and isinstance(existing_data['badges'], str):
+        existing_data['badges'] = existing_data['badges'].split(',') if existing_data['badges'] else []
+    # For events, ensure lists are compared correctly
+    if collection_name in ['events', 'upcoming_events']:
+        for key in ['fight_id', 'winner', 'winner_id']:
+            if key in existing_data and isinstance(existing_data[key], str):
+                existing_data[key] = [existing_data[key]] if existing_data[key] else []
+    return existing_data
+
+# Current documents of a collection for the given ids, fetched with batched reads
+def fetch_existing(db, collection_name, doc_ids):
+    collection = db.collection(collection_name)
+    existing = {}
+    for start in range(0, len(doc_ids), READ_CHUNK_SIZE):
+        refs = [collection.document(doc_id) for doc_id in doc_ids[start:start + READ_CHUNK_SIZE]]
+        for snapshot in db.get_all(refs):
+            if snapshot.exists:
+                existing[snapshot.id] = snapshot.to_dict()
+    return existing
+
+# Commits one batch of (doc_id, data) writes; the batch is rebuilt and retried with
+# exponential backoff on transient errors
+def commit_batch(db, collection_name, docs):
+    collection = db.collection(collection_name)
+    for attempt in range(1, MAX_BATCH_ATTEMPTS + 1):
+        batch = db.batch()
+        for doc_id, doc_data in docs:
+            batch.set(collection.document(doc_id), doc_data)
+        try:
+            batch.commit()
+            return
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_BATCH_ATTEMPTS:
+                raise
+            delay = RETRY_BACKOFF ** attempt
+            logger.warning(f"Batch of {len(docs)} {collection_name} documents failed (attempt {attempt}/{MAX_BATCH_ATTEMPTS}), retrying in {delay:.0f}s: {str(e)}")
+            time.sleep(delay)
+
+# Uploads the new and changed documents of one dataset; returns its counts, with `written`
+# the documents in batches that were actually committed
+def upload_collection(db, item):
+    collection_name = item['collection']
+    id_field = item['id_field']
+    file_path = csv_path(item['dataset'])
+    stats = {'collection': collection_name, 'new': 0, 'updated': 0, 'unchanged': 0, 'written': 0, 'failed': 0, 'seconds': 0.0}
+    started = time.monotonic()
+    logger.info(f"Processing file: {file_path} for collection: {collection_name}")
+
+    if not os.path.exists(file_path):
+        logger.warning(f"Skipping {file_path}: File not found")
+        print(f"Skipping {file_path}: File not found")
+        return stats
+
+    df = pd.read_csv(file_path)
+    if collection_name in ['events', 'upcoming_events']:
+        # Aggregate by event_id
+        df = aggregate_events(df, collection_name, id_field)
+
+    docs = [(str(doc_id), to_document(row)) for doc_id, row in zip(df[id_field], df.to_dict('records'))]
+    existing = fetch_existing(db, collection_name, [doc_id for doc_id, _ in docs])
+    writes = []
+    for doc_id, doc_data in docs:
+        if doc_id not in existing:
+            stats['new'] += 1
+        elif normalize_existing(existing[doc_id], collection_name) != doc_data:
+            stats['updated'] += 1
+        else:
+            stats['unchanged'] += 1
+            continue
+        writes.append((doc_id, doc_data))
+    logger.info(f"{collection_name}: {len(writes)} of {len(docs)} documents new or changed, read in {time.monotonic() - started:.1f}s")
+
+    for start in range(0, len(writes), BATCH_SIZE):
+        chunk = writes[start:start + BATCH_SIZE]
+        try:
+            commit_batch(db, collection_name, chunk)
+            stats['written'] += len(chunk)
+        except Exception as e:
+            stats['failed'] += len(chunk)
+            logger.error(f"Failed to write {len(chunk)} {collection_name} documents ({chunk[0][0]} .. {chunk[-1][0]}): {str(e)}")
+        elapsed = time.monotonic() - started
+        logger.info(f"{collection_name}: {stats['written']}/{len(writes)} documents committed, {stats['failed']} failed, "
+                    f"{stats['written'] / elapsed if elapsed else 0:.0f} docs/s")
+
+    stats['seconds'] = time.monotonic() - started
+    logger.info(f"Uploaded {stats['new']} new and {stats['updated']} updated documents to {collection_name}, "
+                f"{stats['unchanged']} unchanged, {stats['failed']} failed in {stats['seconds']:.1f}s")
+    print(f"Uploaded {stats['new']} new and {stats['updated']} updated documents to {collection_name} "
+          f"({stats['unchanged']} unchanged, {stats['failed']} failed) in {stats['seconds']:.1f}s")
+    return stats
+
+# Uploads every collection concurrently, each in batched reads and batched writes
+def upload_to_firestore(uploads=UPLOADS):
     try:
-        # Path to your service account key JSON file
-        cred_path = r'C:\Users\Krega\Documents\PiePunch\config\firebase-adminsdk.json'
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-        db = firestore.client()
-        
-        # Files to upload and their collection names
-        files = [
-            {'file': 'data/comprehensive_fighter_details.csv', 'collection': 'fighters', 'id_field': 'id'},
-            {'file': 'data/event_details.csv', 'collection': 'events', 'id_field': 'event_id'},
-            {'file': 'data/fight_details.csv', 'collection': 'fights', 'id_field': 'fight_id'},
-            {'file': 'data/upcoming_event_details.csv', 'collection': 'upcoming_events', 'id_field': 'event_id'},
-            {'file': 'data/upcoming_fight_details.csv', 'collection': 'upcoming_fights', 'id_field': 'fight_id'}
-        ]
-        
-        for item in files:
-            file_path = item['file']
-            collection_name = item['collection']
-            id_field = item['id_field']
-            logger.info(f"Processing file: {file_path} for collection: {collection_name}")
-            
-            if not os.path.exists(file_path):
-                logger.warning(f"Skipping {file_path}: File not found")
-                print(f"Skipping {file_path}: File not found")
-                continue
-            
-            df = pd.read_csv(file_path)
-            updated_count = 0
-            new_count = 0
-            
-            if collection_name in ['events', 'upcoming_events']:
-                # Aggregate by event_id
-                agg_columns = {
-                    'date': 'first',
-                    'location': 'first'
-                }
-                if collection_name == 'events':
-                    agg_columns.update({
-                        'fight_id': lambda x: list(x),
-                        'winner': lambda x: list(x),
-                        'winner_id': lambda x: list(x)
-                    })
-                elif collection_name == 'upcoming_events':
-                    agg_columns['event_name'] = 'first'
-                df = df.groupby(id_field).agg(agg_columns).reset_index()
-            
-            # Upload each row as a document
-            for _, row in df.iterrows():
-                doc_id = str(row[id_field])
-                doc_data = row.to_dict()
-                # Handle badges for fighters
-                if 'badges' in doc_data and isinstance(doc_data['badges'], str) and doc_data['badges']:
-                    doc_data['badges'] = doc_data['badges'].split(',')
-                else:
-                    doc_data['badges'] = []
-                # Convert NaN values to None
-                for key, value in doc_data.items():
-                    if isinstance(value, float) and np.isnan(value):
-                        doc_data[key] = None
-                
-                # Check if document exists in Firestore
-                doc_ref = db.collection(collection_name).document(doc_id)
-                existing_doc = doc_ref.get()
-                
-                if existing_doc.exists:
-                    existing_data = existing_doc.to_dict()
-                    # Convert badges to list for comparison
-                    if 'badges' in existing_data and isinstance(existing_data['badges'], str):
-                        existing_data['badges'] = existing_data['badges'].split(',') if existing_data['badges'] else []
-                    # For events, ensure lists are compared correctly
-                    if collection_name in ['events', 'upcoming_events']:
-                        for key in ['fight_id', 'winner', 'winner_id']:
-                            if key in existing_data and isinstance(existing_data[key], str):
-                                existing_data[key] = [existing_data[key]] if existing_data[key] else []
-                    if existing_data == doc_data:
-                        logger.info(f"Skipping unchanged document {doc_id} in {collection_name}")
-                        continue
-                    else:
-                        doc_ref.set(doc_data)
-                        updated_count += 1
-                        logger.info(f"Updated document {doc_id} in {collection_name}")
-                        print(f"Updated document {doc_id} in {collection_name}")
-                else:
-                    doc_ref.set(doc_data)
-                    new_count += 1
-                    logger.info(f"Added new document {doc_id} in {collection_name}")
-                    print(f"Added new document {doc_id} in {collection_name}")
-            
-            logger.info(f"Uploaded {new_count} new and {updated_count} updated documents to {collection_name}")
-            print(f"Uploaded {new_count} new and {updated_count} updated documents to {collection_name}")
-        
-        logger.info("Firestore upload complete!")
-        print("Firestore upload complete!")
+        db = get_firestore_client()
+        # Snapshots saved to the store only are written before they are read
+        export_datasets([item['dataset'] for item in uploads])
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(uploads)) as executor:
+            results = list(executor.map(lambda item: upload_collection(db, item), uploads))
+        elapsed = time.monotonic() - started
+
+        written = sum(stats['written'] for stats in results)
+        failed = sum(stats['failed'] for stats in results)
+        logger.info(f"Firestore upload complete: {written} documents written, {failed} failed in {elapsed:.1f}s "
+                    f"({written / elapsed if elapsed else 0:.0f} docs/s)")
+        print(f"Firestore upload complete! {written} documents written in {elapsed:.1f}s")
+        if failed:
+            raise RuntimeError(f"{failed} documents could not be written")
     
     except Exception as e:
         logger.error(f"Failed to upload to Firestore: {str(e)}")
         print(f"Failed to upload to Firestore: {str(e)}")
         raise
 
+def main(argv=None):
+    logging.basicConfig(filename='firestore_upload_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    upload_to_firestore()
+
 if __name__ == '__main__':
-    upload_to_firestore()
\ No newline at end of file
+    main()
@@ -0,0 +1,171 @@
+import pandas as pd
+import requests
+import argparse
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+from .datastore import csv_path, load_dataset
+from .fetch_engine import close_default_engine, get_default_engine
+from .parsing import PARSE_ERRORS, event_result_row, parse_event_date, parse_event_page, parse_fight_page, parse_fighter_page
+
+logger = logging.getLogger('watch')
+
+# Poll intervals in seconds: slow until the first result, fast while the card is running,
+# and a pause after each result since the next bout needs walkouts and at least a round
+IDLE_INTERVAL = 300
+LIVE_INTERVAL = 45
+AFTER_RESULT_INTERVAL = 180
+MAX_WATCH_HOURS = 10
+# Only the record changes on fight night; the full profile is rebuilt by the weekly pipeline
+FIGHTER_LIVE_FIELDS = ['wins', 'losses', 'draws']
+
+# Earliest upcoming event dated yesterday or later; yesterday covers cards running past midnight UTC
+def find_current_event(today=None):
+    today = today or date.today()
+    try:
+        df = load_dataset('upcoming_event_details', ['event_id', 'date']).dropna(subset=['date'])
+    except FileNotFoundError:
+        logger.error(f"{csv_path('upcoming_event_details')} not found")
+        return None
+    candidates = []
+    for event_id, event_date in zip(df['event_id'], df['date']):
+        if event_date.date() >= today - timedelta(days=1):
+            candidates.append((event_date.date(), event_id))
+    return min(candidates)[1] if candidates else None
+
+def next_interval(new_results, decided):
+    if new_results:
+        return AFTER_RESULT_INTERVAL
+    return LIVE_INTERVAL if decided else IDLE_INTERVAL
+
+def create_publisher(dry_run=False):
+    if dry_run:
+        def publish(collection, doc_id, data, merge=False):
+            logger.info(f"[dry run] {collection}/{doc_id}: {data}")
+        return publish
+
+    from .upload_to_firestore import get_firestore_client, to_document
+    db = get_firestore_client()
+
+    def publish(collection, doc_id, data, merge=False):
+        # Merged updates only touch the given fields, so fighter badges and stats stay intact
+        db.collection(collection).document(doc_id).set(data if merge else to_document(data), merge=merge)
+        logger.info(f"Pushed {collection}/{doc_id}")
+    return publish
+
+# Polls one event page and pushes each decided bout as soon as its result shows up
+class EventWatcher:
+    def __init__(self, event_id, engine, publish):
+        self.event_id = event_id
+        self.event_link = f"http://ufcstats.com/event-details/{event_id}"
+        self.engine = engine
+        self.publish = publish
+        self.decided = set()
+        # Bouts with a result whose ingest failed; retried on every poll until they go through
+        self.failed = set()
+        self.bouts = None
+
+    def finished(self):
+        return self.bouts is not None and 0 < self.bouts <= len(self.decided)
+
+    async def poll(self):
+        response = await self.engine.fetch(self.event_link)
+        # An unchanged page still has to be walked while a failed bout waits for its retry,
+        # since the page may never change again after the last result
+        if response.unchanged and self.bouts is not None and not self.failed:
+            return 0
+        event = parse_event_page(response.content)
+        self.bouts = len(event['fights'])
+        new_results = 0
+        for fight in event['fights']:
+            fight_id = fight['fight_link'][-16:]
+            if not fight['result'] or fight_id in self.decided:
+                continue
+            try:
+                await self.ingest(event, fight)
+            except requests.exceptions.RequestException as e:
+                # Picked up again on the next poll
+                logger.error(f"Failed to ingest {fight['fight_link']}: {str(e)}")
+                self.failed.add(fight_id)
+                continue
+            except PARSE_ERRORS as e:
+                # A page published half filled in; the bout stays undecided and is retried on the next poll
+                logger.error(f"Failed to parse {fight['fight_link']}: {type(e).__name__}: {str(e)}")
+                self.failed.add(fight_id)
+                continue
+            self.failed.discard(fight_id)
+            self.decided.add(fight_id)
+            new_results += 1
+        return new_results
+
+    async def ingest(self, event, fight):
+        fight_link = fight['fight_link']
+        if fight['result'] != "win":
+            # Draws and no contests are not kept in event_details.csv either
+            logger.info(f"{fight['r_name']} vs {fight['b_name']} ended without a winner ({fight['result']})")
+            return
+        response = await self.engine.fetch(fight_link)
+        data_dic = parse_fight_page(response.content, fight_link)
+        event_date = parse_event_date(event['date'])
+        data_dic["date"] = event_date.strftime("%Y/%m/%d") if event_date else None
+        self.publish('fights', data_dic['fight_id'], data_dic)
+
+        results = [event_result_row(event, self.event_id, f) for f in event['fights'] if f['result'] == "win"]
+        self.publish('events', self.event_id, {
+            "event_id": self.event_id,
+            "date": event['date'],
+            "location": event['location'],
+            "fight_id": [row['fight_id'] for row in results],
+            "winner": [row['winner'] for row in results],
+            "winner_id": [row['winner_id'] for row in results]
+        })
+
+        for fighter_id in (fight['r_id'], fight['b_id']):
+            response = await self.engine.fetch(f"http://ufcstats.com/fighter-details/{fighter_id}")
+            fighter = parse_fighter_page(response.content, fighter_id)
+            self.publish('fighters', fighter_id, {field: fighter[field] for field in FIGHTER_LIVE_FIELDS}, merge=True)
+        logger.info(f"Ingested {fight['r_name']} def. {fight['b_name']} ({data_dic['method']})")
+
+async def watch(watcher, max_hours=MAX_WATCH_HOURS):
+    deadline = time.monotonic() + max_hours * 3600
+    while time.monotonic() < deadline:
+        try:
+            new_results = await watcher.poll()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to poll {watcher.event_link}: {str(e)}")
+            new_results = 0
+        except PARSE_ERRORS as e:
+            logger.error(f"Failed to parse {watcher.event_link}: {type(e).__name__}: {str(e)}")
+            new_results = 0
+        if watcher.finished():
+            logger.info(f"All {watcher.bouts} bouts of {watcher.event_id} decided, stopping.")
+            return
+        interval = next_interval(new_results, watcher.decided)
+        logger.info(f"{len(watcher.decided)}/{watcher.bouts} bouts decided, next poll in {interval}s")
+        await asyncio.sleep(interval)
+    logger.warning(f"Stopped watching {watcher.event_id} after {max_hours}h with {len(watcher.decided)}/{watcher.bouts} bouts decided.")
+
+def main(argv=None):
+    logging.basicConfig(filename='watch_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Follow a live event and push each result to Firestore as soon as it is posted')
+    parser.add_argument('--event-id', help='event to watch; defaults to the next event in upcoming_event_details.csv')
+    parser.add_argument('--max-hours', type=float, default=MAX_WATCH_HOURS, help='give up after this many hours')
+    parser.add_argument('--dry-run', action='store_true', help='log the documents instead of writing them to Firestore')
+    args = parser.parse_args(argv)
+
+    event_id = args.event_id or find_current_event()
+    if event_id is None:
+        logger.info("No current event to watch.")
+        print("No current event to watch.")
+        return
+    watcher = EventWatcher(event_id, get_default_engine(), create_publisher(args.dry_run))
+    logger.info(f"Watching event {event_id}")
+    try:
+        asyncio.run(watch(watcher, args.max_hours))
+    finally:
+        close_default_engine()
+    print(f"Watch complete. {len(watcher.decided)} bouts decided for event {event_id}.")
+
+if __name__ == '__main__':
+    main()